@@ -15,6 +15,7 @@ def index_and_find_path(request):
             print("Starting data indexing...")
             indexer = GraphIndexer()
             index_result = await indexer.index_data()
+            await indexer.aclose()
             indexer.close()
             
             if index_result["status"] != "success":
@@ -30,7 +31,7 @@ def index_and_find_path(request):
             print("Finding shortest path...")
             finder = PathFinder()
             path_result = await finder.process()
-            finder.close()
+            await finder.close()
             
             if path_result["status"] != "success":
                 return Response({
@@ -14,6 +14,14 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
+# uvloop (libuv) przed startem Django - asyncio.run() w widokach też go użyje
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    # Brak uvloop na Windows - zostaje domyślna pętla asyncio
+    pass
+
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
 })
@@ -190,6 +190,12 @@ LOGGING = {
             'filename': os.path.join(LOGS_DIR, 'pilot.log'),
             'formatter': 'verbose',
         },
+        # Zapis na konsolę w osobnym wątku - logowanie nie blokuje pętli zdarzeń
+        'queue': {
+            'class': 'logging.handlers.QueueHandler',
+            'handlers': ['console'],
+            'respect_handler_level': True,
+        },
     },
     'loggers': {
         'api.views.pilot_views': {
@@ -197,6 +203,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'modules': {
+            'handlers': ['queue'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
@@ -0,0 +1,18 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from modules.web_crawler import purge_stale_documents
+
+class Command(BaseCommand):
+    help = 'Delete crawled documents that are empty, contain error messages or are older than the cache TTL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=24,
+            help='Cache TTL in hours (default: 24)'
+        )
+
+    def handle(self, *args, **options):
+        deleted = purge_stale_documents(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} stale documents'))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-15 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_merge_20241125_1258'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='taglist',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-15 09:30
+
+from django.db import migrations, models
+
+
+def merge_duplicate_file_names(apps, schema_editor):
+    """Keep only the newest analysis per file_name before adding the unique constraint"""
+    FileAnalysis = apps.get_model('core', 'FileAnalysis')
+    duplicated = (
+        FileAnalysis.objects.values('file_name')
+        .annotate(count=models.Count('id'))
+        .filter(count__gt=1)
+        .values_list('file_name', flat=True)
+    )
+    for file_name in list(duplicated):
+        rows = FileAnalysis.objects.filter(file_name=file_name)
+        newest_id = rows.order_by('-updated_at', '-id').values_list('id', flat=True).first()
+        rows.exclude(id=newest_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_alter_taglist_created_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_file_names, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='fileanalysis',
+            name='file_name',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-15 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_alter_fileanalysis_file_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileanalysis',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
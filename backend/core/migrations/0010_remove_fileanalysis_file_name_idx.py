@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-15 12:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_fileanalysis_content_hash'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='fileanalysis',
+            name='core_filean_file_na_1e89f1_idx',
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-15 23:10
+
+from django.db import migrations, models
+
+
+def mark_error_documents(apps, schema_editor):
+    Document = apps.get_model('core', 'Document')
+    Document.objects.filter(
+        models.Q(original_content__icontains='Error') |
+        models.Q(original_content__icontains='filtered_html') |
+        models.Q(processed_content__icontains='Error') |
+        models.Q(processed_content__icontains='filtered_html')
+    ).update(has_error=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_remove_fileanalysis_file_name_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='has_error',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_error_documents, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(condition=models.Q(('has_error', True)), fields=['id'], name='document_has_error_idx'),
+        ),
+    ]
@@ -22,18 +22,21 @@ class ProcessingTask(models.Model):
     result = models.JSONField(null=True, blank=True)
 
 class FileAnalysis(models.Model):
-    file_name = models.CharField(max_length=255)
+    file_name = models.CharField(max_length=255, unique=True)
     file_type = models.CharField(max_length=50)
     content = models.TextField(null=True, blank=True)
     raw_content = models.BinaryField(null=True, blank=True)
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
     category = models.CharField(max_length=50, null=True, blank=True)
     keywords = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
+        # file_name nie potrzebuje osobnego indeksu: unikalny indeks obsługuje równość,
+        # a na PostgreSQL Django dodaje do niego indeks _like (varchar_pattern_ops)
+        # dla file_name__startswith
         indexes = [
-            models.Index(fields=['file_name']),
             models.Index(fields=['file_type']),
         ] 
 
@@ -41,6 +44,8 @@ class Document(models.Model):
     url = models.URLField(max_length=2000, unique=True)
     original_content = models.TextField()
     processed_content = models.TextField()
+    # Wyliczane przy zapisie - sprzątanie nie musi skanować treści przez ILIKE
+    has_error = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -48,6 +53,7 @@ class Document(models.Model):
         indexes = [
             models.Index(fields=['url'], name='document_url_idx'),
             models.Index(fields=['created_at'], name='document_created_at_idx'),
+            models.Index(fields=['id'], name='document_has_error_idx', condition=models.Q(has_error=True)),
         ]
 
     def __str__(self):
@@ -55,5 +61,5 @@ class Document(models.Model):
 
 class TagList(models.Model):
     tags = models.JSONField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
\ No newline at end of file
@@ -0,0 +1,64 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Migrate core to migrate_from, let the test seed data, then migrate to migrate_to"""
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate([('core', self.migrate_from)])
+        self.executor.loader.build_graph()
+        self.old_apps = self.executor.loader.project_state([('core', self.migrate_from)]).apps
+
+    def migrate(self):
+        self.executor.loader.build_graph()
+        self.executor.migrate([('core', self.migrate_to)])
+        return self.executor.loader.project_state([('core', self.migrate_to)]).apps
+
+    def tearDown(self):
+        # Przywróć najnowszy schemat dla kolejnych testów
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes('core'))
+
+
+class MergeDuplicateFileNamesTests(MigrationTestCase):
+    migrate_from = '0007_alter_taglist_created_at'
+    migrate_to = '0008_alter_fileanalysis_file_name'
+
+    def test_keeps_newest_row_per_file_name(self):
+        FileAnalysis = self.old_apps.get_model('core', 'FileAnalysis')
+        FileAnalysis.objects.create(file_name='a.txt', file_type='txt', content='old')
+        FileAnalysis.objects.create(file_name='a.txt', file_type='txt', content='new')
+        FileAnalysis.objects.create(file_name='b.txt', file_type='txt', content='only')
+
+        apps = self.migrate()
+
+        FileAnalysis = apps.get_model('core', 'FileAnalysis')
+        self.assertEqual(
+            dict(FileAnalysis.objects.values_list('file_name', 'content')),
+            {'a.txt': 'new', 'b.txt': 'only'}
+        )
+
+
+class DocumentHasErrorBackfillTests(MigrationTestCase):
+    migrate_from = '0010_remove_fileanalysis_file_name_idx'
+    migrate_to = '0011_document_has_error'
+
+    def test_marks_existing_error_documents(self):
+        Document = self.old_apps.get_model('core', 'Document')
+        Document.objects.create(url='https://example.com/ok', original_content='page', processed_content='content')
+        Document.objects.create(url='https://example.com/original', original_content='Fatal ERROR', processed_content='content')
+        Document.objects.create(url='https://example.com/processed', original_content='page', processed_content='filtered_html')
+
+        apps = self.migrate()
+
+        Document = apps.get_model('core', 'Document')
+        self.assertEqual(
+            set(Document.objects.filter(has_error=True).values_list('url', flat=True)),
+            {'https://example.com/original', 'https://example.com/processed'}
+        )
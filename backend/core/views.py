@@ -151,8 +151,15 @@ class AnalyzeFilesView(APIView):
     def post(self, request):
         try:
             analyzer = FileAnalyzer()
+
+            async def run():
+                try:
+                    return await analyzer.process()
+                finally:
+                    await analyzer.aclose()
+
             # Uruchamiamy asynchroniczną funkcję w synchronicznym kontekście
-            result = asyncio.run(analyzer.process())
+            result = asyncio.run(run())
             return Response({
                 "status": "success",
                 "data": result
@@ -210,8 +217,15 @@ def process_webpage(request):
         
     try:
         crawler = WebCrawlerProcessor()
+
+        async def run():
+            try:
+                return await crawler.process_url(url)
+            finally:
+                await crawler.aclose()
+
         # Używamy async_to_sync do wywołania asynchronicznej metody
-        result = async_to_sync(crawler.process_url)(url)
+        result = async_to_sync(run)()
         return Response(result)
     except Exception as e:
         return Response({
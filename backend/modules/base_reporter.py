@@ -1,10 +1,24 @@
 import aiohttp
+import logging
+from typing import Optional
 from django.conf import settings
 import json
 
+logger = logging.getLogger(__name__)
+
 class BaseReporter:
-    @staticmethod
-    async def send_report(task: str, answer: dict) -> None:
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Get shared HTTP session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, keepalive_timeout=30)
+            )
+        return self._session
+
+    async def send_report(self, task: str, answer: dict) -> None:
         """Send report to central server"""
         report = {
             "task": task,
@@ -12,19 +26,27 @@ class BaseReporter:
             "answer": answer
         }
         
-        print("Sending report with payload:", json.dumps(report, indent=2))
+        print(f"Sending report for task: {task}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Report payload: %s", json.dumps(report))
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{settings.CENTRAL_URL}/report", json=report) as response:
-                    response_text = await response.text()
-                    print(f"Server response status: {response.status}")
-                    print(f"Server response body: {response_text}")
-                    
-                    if response.status != 200:
-                        raise Exception(f"Error sending report: {response_text}")
-                    else:
-                        print("Report sent successfully")
+            session = await self._get_session()
+            async with session.post(f"{settings.CENTRAL_URL}/report", json=report) as response:
+                response_text = await response.text()
+                print(f"Server response status: {response.status}")
+                print(f"Server response body: {response_text}")
+                
+                if response.status != 200:
+                    raise Exception(f"Error sending report: {response_text}")
+                else:
+                    print("Report sent successfully")
         except Exception as e:
             print(f"Error sending report: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
+
+    async def aclose(self) -> None:
+        """Close shared HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
\ No newline at end of file
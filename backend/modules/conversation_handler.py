@@ -396,7 +396,8 @@ class ConversationHandler:
             suggested_actions = self._extract_commands(response.get("content", ""))
             
             # Jeśli w wiadomości pojawiło się nowe zdjęcie, dodaj je do analizy
-            new_images = [url.split('/')[-1] for url in image_urls if url not in [img['url'] for img in processed_images]]
+            processed_urls = {img['url'] for img in processed_images}
+            new_images = [url.split('/')[-1] for url in image_urls if url not in processed_urls]
             if new_images:
                 logger.info(f"Found new images to analyze: {new_images}")
                 suggested_actions.extend([f"ANALYZE {img}" for img in new_images])
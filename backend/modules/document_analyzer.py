@@ -109,4 +109,6 @@ class DocumentAnalyzer:
 
         except Exception as e:
             print(f"Error in analyze_arxiv_document: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
+        finally:
+            await self.reporter.aclose()
\ No newline at end of file
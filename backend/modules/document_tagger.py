@@ -1,4 +1,6 @@
 import os
+import asyncio
+from collections import Counter
 from typing import Dict, List, Optional, Any
 from django.conf import settings
 from datetime import timedelta
@@ -7,6 +9,7 @@ from asgiref.sync import sync_to_async
 from .openai_client import OpenAIClient
 from core.models import FileAnalysis, TagList
 from .base_reporter import BaseReporter
+from .llm_json import parse_json_response
 import json
 
 class DocumentTagger:
@@ -16,6 +19,12 @@ class DocumentTagger:
         self.data_dir = os.path.join(settings.BASE_DIR, 'data', 'raw', 'pliki_z_fabryki')
         self.facts_dir = os.path.join(self.data_dir, 'facts')
         self.cache_ttl = timedelta(hours=24)
+        # Dokumenty krótsze niż ten próg nie są wysyłane do modelu
+        self.min_content_length = 20
+        # Maksymalna liczba tagów przekazywanych do promptu w kroku tagowania
+        self.max_tags = 500
+        # Liczba plików tagowanych równolegle (i jednocześnie trzymanych w pamięci)
+        self.max_in_flight = 8
 
     async def process(self) -> Dict[str, str]:
         """Main processing method"""
@@ -40,19 +49,27 @@ class DocumentTagger:
         except Exception as e:
             print(f"Error in process: {str(e)}")
             raise
+        finally:
+            await self.reporter.aclose()
 
     @sync_to_async
     def _get_cached_tags(self) -> Optional[List[Dict[str, Any]]]:
         """Get cached tags if they exist and are not expired"""
         try:
-            tag_list = TagList.objects.latest('created_at')
+            # Najpierw pobieramy tylko metadane - bez dużej kolumny JSON z tagami
+            tag_list = TagList.objects.only('id', 'updated_at').latest('created_at')
             age = timezone.now() - tag_list.updated_at
             
-            # Sprawdzamy czy cache nie wygasł i czy tagi nie są puste
-            if age > self.cache_ttl or not tag_list.tags:
+            # Sprawdzamy czy cache nie wygasł
+            if age > self.cache_ttl:
+                return None
+
+            # Dopiero świeży cache ładujemy w całości
+            tags = TagList.objects.values_list('tags', flat=True).get(id=tag_list.id)
+            if not tags:
                 return None
                 
-            return tag_list.tags  # Teraz tags to już jest JSON
+            return tags  # Teraz tags to już jest JSON
         except TagList.DoesNotExist:
             return None
 
@@ -67,7 +84,7 @@ class DocumentTagger:
         if cached_tags:
             return cached_tags
 
-        all_tags = set()  # Używamy set() do przechowywania unikalnych tagów
+        tag_counts = Counter()  # Liczymy wystąpienia unikalnych tagów
         
         # Iterujemy po każdym pliku osobno
         for root in [self.data_dir, self.facts_dir]:
@@ -82,6 +99,10 @@ class DocumentTagger:
                 try:
                     with open(file_path, 'r', encoding='utf-8') as f:
                         content = f.read()
+                        if len(content.strip()) < self.min_content_length:
+                            print(f"Skipping near-empty file for tags: {filename}")
+                            continue
+
                         folder = 'facts' if root == self.facts_dir else 'pliki_z_fabryki'
                         
                         print(f"\n=== Analyzing file for tags: {filename} ===")
@@ -191,35 +212,26 @@ class DocumentTagger:
                         )
 
                         if response.get("status") == "success":
-                            try:
-                                # Czyścimy odpowiedź z formatowania Markdown
-                                content = response['content']
-                                if content.startswith('```'):
-                                    content = '\n'.join(content.split('\n')[1:-1])
-                                    if content.startswith('json'):
-                                        content = '\n'.join(content.split('\n')[1:])
-                                
-                                file_tags = json.loads(content)
-                                
-                                # Dodajemy tagi do zbioru wszystkich tagów
-                                # Używamy tuple() do konwersji słownika na niemutowalny typ
+                            # Odpowiedź bywa opakowana w blok ```json ... ```
+                            file_tags = parse_json_response(response['content'])
+                            if file_tags is None:
+                                print(f"Error parsing tags JSON for {filename}")
+                                print(f"Raw response: {response['content']}")
+                            else:
+                                # Zliczamy tagi - słownik serializujemy do JSON, żeby był hashowalny
                                 for tag in file_tags:
-                                    all_tags.add(json.dumps(tag, sort_keys=True))
+                                    tag_counts[json.dumps(tag, sort_keys=True)] += 1
                                 
                                 print(f"Generated {len(file_tags)} tags from {filename}")
-                                
-                            except json.JSONDecodeError as e:
-                                print(f"Error parsing tags JSON for {filename}: {e}")
-                                print(f"Raw response: {response['content']}")
                         else:
                             print(f"Error generating tags for {filename}: {response.get('error')}")
                             
                 except Exception as e:
                     print(f"Error processing file {filename}: {str(e)}")
 
-        # Konwertujemy z powrotem do listy słowników
-        final_tags = [json.loads(tag) for tag in all_tags]
-        print(f"\nTotal unique tags generated: {len(final_tags)}")
+        # Zostawiamy tylko najczęstsze tagi, żeby prompt w kroku 3 nie rósł bez końca
+        final_tags = [json.loads(tag) for tag, _ in tag_counts.most_common(self.max_tags)]
+        print(f"\nTotal unique tags generated: {len(tag_counts)}, kept: {len(final_tags)}")
         
         # Zapisujemy kompletną listę tagów
         await self._save_tags(final_tags)
@@ -258,93 +270,138 @@ class DocumentTagger:
     async def _tag_files(self, tags: List[Dict[str, Any]]) -> Dict[str, str]:
         """Tag files and return mapping of filenames to their comma-separated tags"""
         result = {}
-        
-        for filename in os.listdir(self.data_dir):
-            if not filename.endswith('.txt'):
-                continue
+        tags_json = json.dumps(tags, ensure_ascii=False)
+        # Kolejka ograniczona - w pamięci trzymamy co najwyżej kilka plików naraz
+        queue = asyncio.Queue(maxsize=self.max_in_flight)
 
-            # Check cache first
-            cached = await self._get_cached_analysis(filename)
-            if cached and cached.keywords:
-                result[filename] = cached.keywords
-                continue
-
-            # Get file content
+        async def producer() -> None:
             try:
-                with open(os.path.join(self.data_dir, filename), 'r', encoding='utf-8') as f:
-                    content = f.read()
-
-                print(f"\n=== Processing file: {filename} ===")
-
-                system_prompt = """
-                You are a document tagging expert. Your task is to analyze a provided document and assign the most relevant tags from the predefined list.
-
-                <prompt_objective>
-                Your sole purpose is to assign tags from the provided list to a given document. Use only the tags explicitly provided in the list, ensuring the following:
-                1. If a tag from the list accurately describes the content of the document, include it in the output.
-                2. If no tags from the list apply to the document, return an empty string (`""`).
-                3. The output must be a single, comma-separated list of tags without any additional text or formatting.
-                4. Do not add, create, or infer tags outside the predefined list.
-                </prompt_objective>
-
-                <prompt_rules>
-                - Only use tags from the provided list.
-                - Format the output as a comma-separated string, e.g., `tag1,tag2,tag3`.
-                - Return an empty string (`""`) if no tags match the document.
-                - Avoid repetition of tags in the output.
-                - Do not include any additional text or formatting outside the required output format.
-                </prompt_rules>
-
-                <examples>
-                1. **USER**: Please analyze this document and assign appropriate tags from the provided list: `marketing, social media, content creation, SEO`  
-                `<document>This document is about effective SEO techniques and best practices.</document>`  
-                **AI**: `SEO`
-
-                2. **USER**: Please analyze this document and assign appropriate tags from the provided list: `marketing, social media, content creation, SEO`  
-                `<document>This document is about gardening tips and techniques.</document>`  
-                **AI**: `""`
-
-                3. **USER**: Please analyze this document and assign appropriate tags from the provided list: `marketing, social media, content creation, SEO`  
-                `<document>This document covers marketing, social media strategies, content creation, and SEO all at once.</document>`  
-                **AI**: `marketing,social media,content creation,SEO`
-                </examples>
-
-                """
-
-                user_prompt = f"""
-                Please analyze this document and list appropriate tag names from these tags: {json.dumps(tags, ensure_ascii=False)}
-
-                <document>
-                {content}
-                </document>
-                """
-
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ]
-
-                response = await self.openai_client.chat_completion(
-                    messages=messages,
-                    temperature=0.3
-                )
-
-                if response.get("status") == "success":
-                    file_tags = response['content'].strip().strip('"').strip("'")
-                    if file_tags == '""' or file_tags == "''":
-                        file_tags = ""
-                    
-                    print(f"Generated tags: {file_tags}")
-                    
-                    await self._save_file_tags(filename, file_tags)
-                    result[filename] = file_tags
-
-            except Exception as e:
-                print(f"Error tagging file {filename}: {str(e)}")
-                result[filename] = ""
-
+                with os.scandir(self.data_dir) as entries:
+                    filenames = [
+                        entry.name for entry in entries
+                        if entry.is_file() and entry.name.endswith('.txt')
+                    ]
+
+                for filename in filenames:
+                    # Check cache first
+                    cached = await self._get_cached_analysis(filename)
+                    if cached and cached.keywords:
+                        result[filename] = cached.keywords
+                        continue
+
+                    # Get file content
+                    try:
+                        content = await asyncio.to_thread(
+                            self._read_text, os.path.join(self.data_dir, filename)
+                        )
+                    except Exception as e:
+                        print(f"Error reading file {filename}: {str(e)}")
+                        result[filename] = ""
+                        continue
+
+                    await queue.put((filename, content))
+            finally:
+                # Sygnał zakończenia dla każdego workera
+                for _ in range(self.max_in_flight):
+                    await queue.put(None)
+
+        async def worker() -> None:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                filename, content = item
+                result[filename] = await self._tag_file(filename, content, tags_json)
+
+        await asyncio.gather(producer(), *(worker() for _ in range(self.max_in_flight)))
         return result
 
+    @staticmethod
+    def _read_text(file_path: str) -> str:
+        """Read text file contents"""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    async def _tag_file(self, filename: str, content: str, tags_json: str) -> str:
+        """Assign tags from the tag list to a single file"""
+        try:
+            if len(content.strip()) < self.min_content_length:
+                print(f"Skipping near-empty file: {filename}")
+                await self._save_file_tags(filename, "")
+                return ""
+
+            print(f"\n=== Processing file: {filename} ===")
+
+            system_prompt = """
+            You are a document tagging expert. Your task is to analyze a provided document and assign the most relevant tags from the predefined list.
+
+            <prompt_objective>
+            Your sole purpose is to assign tags from the provided list to a given document. Use only the tags explicitly provided in the list, ensuring the following:
+            1. If a tag from the list accurately describes the content of the document, include it in the output.
+            2. If no tags from the list apply to the document, return an empty string (`""`).
+            3. The output must be a single, comma-separated list of tags without any additional text or formatting.
+            4. Do not add, create, or infer tags outside the predefined list.
+            </prompt_objective>
+
+            <prompt_rules>
+            - Only use tags from the provided list.
+            - Format the output as a comma-separated string, e.g., `tag1,tag2,tag3`.
+            - Return an empty string (`""`) if no tags match the document.
+            - Avoid repetition of tags in the output.
+            - Do not include any additional text or formatting outside the required output format.
+            </prompt_rules>
+
+            <examples>
+            1. **USER**: Please analyze this document and assign appropriate tags from the provided list: `marketing, social media, content creation, SEO`  
+            `<document>This document is about effective SEO techniques and best practices.</document>`  
+            **AI**: `SEO`
+
+            2. **USER**: Please analyze this document and assign appropriate tags from the provided list: `marketing, social media, content creation, SEO`  
+            `<document>This document is about gardening tips and techniques.</document>`  
+            **AI**: `""`
+
+            3. **USER**: Please analyze this document and assign appropriate tags from the provided list: `marketing, social media, content creation, SEO`  
+            `<document>This document covers marketing, social media strategies, content creation, and SEO all at once.</document>`  
+            **AI**: `marketing,social media,content creation,SEO`
+            </examples>
+
+            """
+
+            user_prompt = f"""
+            Please analyze this document and list appropriate tag names from these tags: {tags_json}
+
+            <document>
+            {content}
+            </document>
+            """
+
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ]
+
+            response = await self.openai_client.chat_completion(
+                messages=messages,
+                temperature=0.3
+            )
+
+            if response.get("status") == "success":
+                file_tags = response['content'].strip().strip('"').strip("'")
+                if file_tags == '""' or file_tags == "''":
+                    file_tags = ""
+                
+                print(f"Generated tags: {file_tags}")
+                
+                await self._save_file_tags(filename, file_tags)
+                return file_tags
+
+            print(f"Error tagging file {filename}: {response.get('error')}")
+            return ""
+
+        except Exception as e:
+            print(f"Error tagging file {filename}: {str(e)}")
+            return ""
+
     @sync_to_async
     def _get_cached_analysis(self, file_name: str) -> Optional[FileAnalysis]:
         """Get cached file analysis if exists and not expired"""
@@ -1,10 +1,14 @@
 import os
-import json
-import base64
+import pybase64
+import xxhash
+import asyncio
+import aiofiles
 import aiohttp
-from typing import Dict, List, Tuple
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
 from .base_processor import BaseProcessor
 from django.conf import settings
+from django.db import transaction
 from core.models import FileAnalysis
 from django.utils import timezone
 from datetime import timedelta
@@ -14,6 +18,27 @@ from modules.text.analyzer import TextAnalyzer
 from io import BytesIO
 from .base_reporter import BaseReporter
 
+def _encode_image_file(file_path: str) -> str:
+    """Read and base64-encode an image file"""
+    return pybase64.b64encode(Path(file_path).read_bytes()).decode('ascii')
+
+def hash_file(file_path: str) -> str:
+    """Hash file contents with xxh3, reading it in chunks"""
+    digest = xxhash.xxh3_64()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+@sync_to_async
+def get_contents_by_hash(digests: List[str], ttl: timedelta) -> Dict[str, str]:
+    """Get non-expired analysis contents of files with given xxh3 content hashes"""
+    rows = FileAnalysis.objects.filter(
+        content_hash__in=digests,
+        updated_at__gte=timezone.now() - ttl
+    ).exclude(content__isnull=True).exclude(content='').values_list('content_hash', 'content')
+    return dict(rows)
+
 class FileAnalyzer(BaseProcessor):
     def __init__(self):
         super().__init__()
@@ -35,53 +60,84 @@ class FileAnalyzer(BaseProcessor):
         # Czas ważności cache'a (np. 24 godziny)
         self.cache_ttl = timedelta(hours=24)
 
+        # Maksymalna liczba równoległych zapytań do OpenAI
+        self.max_concurrency = 8
+
+        # Limity rozmiaru plików przyjmowanych przez API
+        self.max_image_size = 20 * 1024 * 1024  # 20MB
+        self.max_audio_size = 25 * 1024 * 1024  # 25MB (OpenAI's limit)
+
     @sync_to_async
-    def _get_cached_analysis(self, file_name: str, check_type: str = 'both') -> FileAnalysis:
+    def _bulk_get_cached(self, file_names: List[str], check_type: str = 'both') -> Dict[str, FileAnalysis]:
         """
-        Get cached analysis if exists and not expired
+        Get cached analyses for many files with a single query
         check_type: 'content', 'category' or 'both'
         """
-        try:
-            cached = FileAnalysis.objects.get(file_name=file_name)
-            age = timezone.now() - cached.updated_at
-            
+        # Pobieramy tylko kolumny potrzebne do danego sprawdzenia
+        fields = ['file_name', 'file_type', 'updated_at']
+        if check_type in ['content', 'both']:
+            fields.append('content')
+        if check_type in ['category', 'both']:
+            fields.append('category')
+
+        now = timezone.now()
+        cached = {}
+        for analysis in FileAnalysis.objects.filter(file_name__in=file_names).only(*fields):
             # Zawsze sprawdź czy cache nie wygasł
-            if age > self.cache_ttl:
-                return None
+            if now - analysis.updated_at > self.cache_ttl:
+                continue
             
             # Sprawdź content tylko jeśli o to prosiliśmy
-            if check_type in ['content', 'both'] and not cached.content:
-                return None
+            if check_type in ['content', 'both'] and not analysis.content:
+                continue
             
             # Sprawdź kategorię tylko jeśli o to prosiliśmy
-            if check_type in ['category', 'both'] and not cached.category:
-                return None
+            if check_type in ['category', 'both'] and not analysis.category:
+                continue
             
-            return cached
-        except FileAnalysis.DoesNotExist:
+            cached[analysis.file_name] = analysis
+        return cached
+
+    @staticmethod
+    def _try_hash_file(file_path: str) -> Optional[str]:
+        """Hash file contents, or return None if the file cannot be read"""
+        try:
+            return hash_file(file_path)
+        except OSError as e:
+            print(f"Error reading {file_path}: {str(e)}")
             return None
 
     @sync_to_async
-    def _save_analysis(self, file_name: str, file_type: str, content: str, raw_content: bytes = None, category: str = None) -> None:
-        """Save analysis to database"""
+    def _bulk_upsert(self, analyses: List[FileAnalysis]) -> None:
+        """Insert or update many analyses with a single query"""
+        if not analyses:
+            return
+
         try:
-            # Normalizujemy nazwę pliku - bierzemy część po ::
-            if '::' in file_name:
-                file_name = file_name.split('::')[1]
-            
-            print(f"Saving analysis for normalized file name: {file_name}")
-            
-            FileAnalysis.objects.update_or_create(
-                file_name=file_name,
-                defaults={
-                    'file_type': file_type,
-                    'content': content,
-                    'raw_content': raw_content,
-                    'category': category
-                }
+            print(f"Saving {len(analyses)} analyses")
+            FileAnalysis.objects.bulk_create(
+                analyses,
+                update_conflicts=True,
+                unique_fields=['file_name'],
+                update_fields=['file_type', 'content', 'content_hash', 'category', 'updated_at']
             )
         except Exception as e:
-            print(f"Error saving analysis: {str(e)}")
+            print(f"Error saving analyses: {str(e)}")
+
+    @sync_to_async
+    def _update_categories(self, updates: List[Tuple[str, str]]) -> None:
+        """Update only the category column of already analyzed files"""
+        now = timezone.now()
+        try:
+            # Jeden commit dla całego przebiegu zamiast osobnego na każdy plik
+            with transaction.atomic(savepoint=False):
+                for file_name, category in updates:
+                    FileAnalysis.objects.filter(file_name=file_name).update(
+                        category=category,
+                        updated_at=now
+                    )
+        except Exception as e:
+            print(f"Error saving categories: {str(e)}")
 
     async def process(self) -> Dict[str, List[str]]:
         """Main processing method"""
@@ -119,69 +175,142 @@ class FileAnalyzer(BaseProcessor):
             print(f"Directory not found: {self.data_dir}")
             return results
             
-        files = os.listdir(self.data_dir)
-        print(f"Found {len(files)} files in directory")
+        # scandir zwraca typ wpisu razem z nazwą - bez osobnego stat() na każdy plik
+        with os.scandir(self.data_dir) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        print(f"Found {len(entries)} files in directory")
         
-        for filename in sorted(files):
+        to_analyze = []
+        for entry in entries:
+            filename = entry.name
             if 'fakty' in filename.lower() or filename.startswith('.'):
                 print(f"Skipping file: {filename}")
                 continue
                 
-            file_path = os.path.join(self.data_dir, filename)
-            if not os.path.isfile(file_path):
+            file_path = entry.path
+            if not entry.is_file():
                 print(f"Skipping non-file: {file_path}")
                 continue
                 
-            extension = filename.split('.')[-1].lower()
+            extension = os.path.splitext(filename)[1][1:].lower()
             
             if extension in self.supported_extensions:
-                try:
-                    # Sprawdź cache
-                    cached = await self._get_cached_analysis(filename, check_type='content')
-                    if cached:
-                        results.append((filename, cached.content))
-                        continue
-
-                    print(f"Processing file: {filename} ({extension})")
-                    content = await self.supported_extensions[extension](file_path)
-                    if content:
-                        # Zapisz do cache'a
-                        await self._save_analysis(filename, extension, content)
-                        results.append((filename, content))
-                        print(f"Successfully processed: {filename}")
-                    else:
-                        print(f"No content extracted from: {filename}")
-                except Exception as e:
-                    print(f"Error processing {filename}: {str(e)}")
+                to_analyze.append((filename, file_path, extension))
             else:
                 print(f"Unsupported file extension: {extension} for file {filename}")
+
+        # Sprawdź cache dla wszystkich plików jednym zapytaniem
+        cache = await self._bulk_get_cached(
+            [filename for filename, _, _ in to_analyze], check_type='content'
+        )
+        pending = [item for item in to_analyze if item[0] not in cache]
+
+        # Pliki o identycznej zawartości analizujemy tylko raz - także między uruchomieniami
+        hashes = await asyncio.to_thread(
+            lambda: [self._try_hash_file(file_path) for _, file_path, _ in pending]
+        )
+        # Pliku, którego nie da się odczytać, nie analizujemy - reszta idzie dalej
+        hashed = [(item, digest) for item, digest in zip(pending, hashes) if digest is not None]
+        pending = [item for item, _ in hashed]
+        digests = {item[0]: digest for item, digest in hashed}
+        by_digest = await get_contents_by_hash(list(set(digests.values())), self.cache_ttl)
+
+        unique = {}
+        for item in pending:
+            digest = digests[item[0]]
+            if digest not in by_digest and digest not in unique:
+                unique[digest] = item
+
+        # Pliki analizujemy równolegle, ograniczając liczbę jednoczesnych zapytań do API
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def guarded(filename: str, file_path: str, extension: str) -> Optional[str]:
+            async with semaphore:
+                return await self._analyze_one(filename, file_path, extension)
+
+        outcomes = await asyncio.gather(
+            *(guarded(*item) for item in unique.values()),
+            return_exceptions=True
+        )
+        by_digest.update(zip(unique.keys(), outcomes))
+        analyzed = {filename: by_digest[digests[filename]] for filename, _, _ in pending}
+
+        # Zapisz nowe analizy do cache'a jednym zapytaniem
+        await self._bulk_upsert([
+            FileAnalysis(
+                file_name=filename,
+                file_type=extension,
+                content=analyzed[filename],
+                content_hash=digests[filename]
+            )
+            for filename, _, extension in pending
+            if analyzed[filename] and not isinstance(analyzed[filename], Exception)
+        ])
+
+        for filename, _, _ in to_analyze:
+            if filename in cache:
+                results.append((filename, cache[filename].content))
+                continue
+            if filename not in analyzed:
+                continue
+
+            outcome = analyzed[filename]
+            if isinstance(outcome, Exception):
+                print(f"Error processing {filename}: {str(outcome)}")
+            elif outcome:
+                results.append((filename, outcome))
                     
         return results
 
+    async def _analyze_one(self, filename: str, file_path: str, extension: str) -> Optional[str]:
+        """Analyze a single file"""
+        print(f"Processing file: {filename} ({extension})")
+        content = await self.supported_extensions[extension](file_path)
+        if content:
+            print(f"Successfully processed: {filename}")
+            return content
+
+        print(f"No content extracted from: {filename}")
+        return None
+
     async def _process_text(self, file_path: str) -> str:
         """Process text files"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
+            async with aiofiles.open(file_path, 'r', encoding='utf-8') as file:
+                return await file.read()
         except Exception as e:
             print(f"Error reading text file {file_path}: {str(e)}")
             return ""
 
-    async def _process_image(self, file_obj: BytesIO) -> str:
-        """Process image files"""
+    async def _process_image(self, file_obj: Union[str, BytesIO]) -> str:
+        """Process image files (path on disk or in-memory file)"""
+        file_name = file_obj if isinstance(file_obj, str) else file_obj.name
         try:
-            print(f"\n=== Processing image: {file_obj.name} ===")
+            print(f"\n=== Processing image: {file_name} ===")
             
             # Wyciągamy samą nazwę pliku bez ścieżki
-            file_name = os.path.basename(file_obj.name)
+            file_name = os.path.basename(file_name)
             if '::' in file_name:
                 # Jeśli nazwa zawiera separator ::, bierzemy część po nim
                 file_name = file_name.split('::')[1]
             
             print(f"Processing image with normalized name: {file_name}")
             
-            # Konwertujemy BytesIO na base64
-            image_data = base64.b64encode(file_obj.getvalue()).decode('utf-8')
+            # Nie czytamy ani nie wysyłamy plików, które API i tak odrzuci
+            if isinstance(file_obj, str):
+                size = os.stat(file_obj).st_size
+            else:
+                size = file_obj.getbuffer().nbytes
+            if size > self.max_image_size:
+                print(f"Skipping image {file_name}: {size} bytes exceeds limit")
+                return ""
+
+            if isinstance(file_obj, str):
+                # Czytamy i kodujemy plik poza pętlą zdarzeń
+                image_data = await asyncio.to_thread(_encode_image_file, file_obj)
+            else:
+                # Konwertujemy BytesIO na base64
+                image_data = pybase64.b64encode(file_obj.getvalue()).decode('ascii')
             
             response = await self.openai_client.chat_completion_with_vision(
                 image_data=f"data:image/png;base64,{image_data}",
@@ -206,16 +335,26 @@ class FileAnalyzer(BaseProcessor):
         """Process audio files"""
         try:
             print(f"\n=== Processing audio: {file_path} ===")
-            with open(file_path, 'rb') as audio_file:
+            size = os.path.getsize(file_path)
+            if size > self.max_audio_size:
+                print(f"Skipping audio {file_path}: {size} bytes exceeds limit")
+                return ""
+
+            # Otwieramy plik poza pętlą zdarzeń; klient wysyła go kawałkami
+            # zamiast trzymać całe nagranie w pamięci
+            audio_file = await asyncio.to_thread(open, file_path, 'rb')
+            try:
                 print("Sending audio request to OpenAI")
                 response = await self.openai_client.transcribe_audio(audio_file)
                 print("Received audio response from OpenAI:", response)
-                
-                if isinstance(response, dict):
-                    content = response.get('text', '')
-                    print(f"Extracted content from audio response: {content}")
-                    return content
-                return str(response)
+            finally:
+                audio_file.close()
+            
+            if isinstance(response, dict):
+                content = response.get('text', '')
+                print(f"Extracted content from audio response: {content}")
+                return content
+            return str(response)
         except Exception as e:
             print(f"Error processing audio {file_path}: {str(e)}")
             print(f"Full error details:", e.__class__.__name__, str(e))
@@ -227,70 +366,90 @@ class FileAnalyzer(BaseProcessor):
             "people": [],
             "hardware": []
         }
-        
-        for filename, original_content in files_content:
-            try:
-                # Sprawdź cache dla kategorii
-                cached = await self._get_cached_analysis(file_name=filename, check_type='category')
-                if cached and cached.category:
-                    if cached.category in ['people', 'hardware']:
-                        categories[cached.category].append(filename)
-                    continue
-
-                print(f"\n=== Categorizing file: {filename} ===")
-                
-                user_prompt = f"""
-                                Analyze the text and determine whether it contains information about:
-
-                                People who were explicitly captured, or recent and concrete traces of their presence—assign these files the tag "people". Do not consider indirect mentions or hypothetical situations (e.g., digressions or humor) as evidence for the 'people' tag. Only assign 'people' if the text explicitly ties captured individuals or recent and concrete traces of their presence to the context of the described event.
-                                Hardware malfunctions that have been repaired (do not include issues related to software)—assign these files the tag "hardware". Assign the 'hardware' tag only if the text explicitly mentions malfunctions of physical hardware components and confirms their repair. Do not include mentions of software issues, hypothetical problems, or unresolved malfunctions.
-                                If neither of these conditions is met, assign the tag "other".
-                                
-                                <text for analysis>
-                                {original_content}
-                                </text for analysis>"""
-
-                analyzer = TextAnalyzer()
-                result = await analyzer.analyze_and_single_tag_text(user_prompt)
-                
-                if result.get("status") == "success":
-                    try:
-                        # Czyścimy odpowiedź z markdown
-                        analysis_content = result['content']
-                        if analysis_content.startswith('```'):
-                            analysis_content = '\n'.join(analysis_content.split('\n')[1:-1])
-                        
-                        response_data = json.loads(analysis_content)
-                        category = response_data["data"]["tags"][0].lower()
-                        
-                        # Zapisz kategorię do cache'a, ale zachowaj oryginalny content!
-                        await self._save_analysis(
-                            file_name=filename,
-                            file_type=filename.split('.')[-1],
-                            content=original_content,  # Używamy oryginalnego contentu
-                            category=category
-                        )
-                        
-                        if category in ['people', 'hardware']:
-                            categories[category].append(filename)
-                            print(f"File {filename} categorized as: {category}")
-                            print(f"Reasoning: {response_data['data']['reasoning']}")
-                    except json.JSONDecodeError as e:
-                        print(f"Error parsing JSON response for {filename}")
-                        print(f"JSON Error details: {str(e)}")
-                        print(f"Attempted to parse: {result['content']}")
-                else:
-                    print(f"Error getting category for {filename}: {result.get('error')}")
-                    
-            except Exception as e:
-                print(f"Error categorizing {filename}: {str(e)}")
+
+        # Sprawdź cache kategorii dla wszystkich plików jednym zapytaniem
+        cache = await self._bulk_get_cached(
+            [filename for filename, _ in files_content], check_type='category'
+        )
+        pending = [item for item in files_content if item[0] not in cache]
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def guarded(filename: str, original_content: str) -> Optional[str]:
+            async with semaphore:
+                return await self._categorize_one(filename, original_content)
+
+        outcomes = await asyncio.gather(
+            *(guarded(filename, content) for filename, content in pending),
+            return_exceptions=True
+        )
+        categorized = dict(zip((filename for filename, _ in pending), outcomes))
+
+        # Zapisz kategorie do cache'a - content zapisał już krok analizy
+        await self._update_categories([
+            (filename, categorized[filename])
+            for filename, _ in pending
+            if categorized[filename] and not isinstance(categorized[filename], Exception)
+        ])
+
+        for filename, _ in files_content:
+            if filename in cache:
+                category = cache[filename].category
+            else:
+                category = categorized[filename]
+
+            if isinstance(category, Exception):
+                print(f"Error categorizing {filename}: {str(category)}")
+            elif category in categories:
+                categories[category].append(filename)
                 
         return categories
 
+    async def _categorize_one(self, filename: str, original_content: str) -> Optional[str]:
+        """Categorize a single file"""
+        print(f"\n=== Categorizing file: {filename} ===")
+        
+        user_prompt = f"""
+                        Analyze the text and determine whether it contains information about:
+
+                        People who were explicitly captured, or recent and concrete traces of their presence—assign these files the tag "people". Do not consider indirect mentions or hypothetical situations (e.g., digressions or humor) as evidence for the 'people' tag. Only assign 'people' if the text explicitly ties captured individuals or recent and concrete traces of their presence to the context of the described event.
+                        Hardware malfunctions that have been repaired (do not include issues related to software)—assign these files the tag "hardware". Assign the 'hardware' tag only if the text explicitly mentions malfunctions of physical hardware components and confirms their repair. Do not include mentions of software issues, hypothetical problems, or unresolved malfunctions.
+                        If neither of these conditions is met, assign the tag "other".
+                        
+                        <text for analysis>
+                        {original_content}
+                        </text for analysis>"""
+
+        analyzer = TextAnalyzer()
+        result = await analyzer.analyze_and_single_tag_text(user_prompt)
+        
+        if result.get("status") != "success":
+            print(f"Error getting category for {filename}: {result.get('error')}")
+            return None
+
+        # Odpowiedź jest już sparsowana przez TextAnalyzer
+        response_data = result.get("parsed")
+        try:
+            category = response_data["data"]["tags"][0].lower()
+        except (KeyError, IndexError, TypeError, AttributeError) as e:
+            print(f"Error parsing JSON response for {filename}")
+            print(f"JSON Error details: {str(e)}")
+            print(f"Attempted to parse: {result['content']}")
+            return None
+
+        if category in ['people', 'hardware']:
+            print(f"File {filename} categorized as: {category}")
+            print(f"Reasoning: {response_data['data'].get('reasoning')}")
+        return category
+
     async def _send_report(self, categorized_files: Dict[str, List[str]]) -> None:
         """Send report to central server"""
         answer = {
             "people": categorized_files.get('people', []),
             "hardware": categorized_files.get('hardware', [])
         }
-        await self.reporter.send_report("kategorie", answer)
\ No newline at end of file
+        await self.reporter.send_report("kategorie", answer)
+
+    async def aclose(self) -> None:
+        """Close HTTP session used for reporting"""
+        await self.reporter.aclose()
\ No newline at end of file
@@ -1,148 +1,221 @@
 import aiohttp
+import atexit
 import json
-from typing import Dict, List, Any
+import logging
+from typing import Dict, List, Any, Optional
 from django.conf import settings
 from neo4j import GraphDatabase
 import asyncio
 from asgiref.sync import sync_to_async
+from .path_finder import invalidate_path_cache
 
-class GraphIndexer:
-    def __init__(self):
-        self.neo4j_driver = GraphDatabase.driver(
+logger = logging.getLogger(__name__)
+
+# Jeden driver (i jedna pula połączeń Bolt) na cały proces
+_DRIVER = None
+
+def _get_driver():
+    """Get process-wide Neo4j driver, creating it on first use"""
+    global _DRIVER
+    if _DRIVER is None:
+        _DRIVER = GraphDatabase.driver(
             settings.NEO4J_CONFIG['URI'],
-            auth=(settings.NEO4J_CONFIG['USERNAME'], settings.NEO4J_CONFIG['PASSWORD'])
+            auth=(settings.NEO4J_CONFIG['USERNAME'], settings.NEO4J_CONFIG['PASSWORD']),
+            max_connection_pool_size=32
         )
+        atexit.register(_DRIVER.close)
+    return _DRIVER
+
+class GraphIndexer:
+    def __init__(self):
+        self.neo4j_driver = _get_driver()
         self.api_url = "https://centrala.ag3nts.org/apidb"
         self.api_key = settings.DEFAULT_API_KEY
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Liczba wierszy wysyłanych w jednym zapytaniu UNWIND
+        self.batch_size = 10000
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Get shared HTTP session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, keepalive_timeout=30)
+            )
+        return self._session
 
     async def fetch_data(self, query: str) -> List[Dict[str, Any]]:
         """Fetch data from the API"""
         try:
-            async with aiohttp.ClientSession() as session:
-                payload = {
-                    "task": "database",
-                    "apikey": self.api_key,
-                    "query": query
-                }
+            session = await self._get_session()
+            payload = {
+                "task": "database",
+                "apikey": self.api_key,
+                "query": query
+            }
+            
+            # Bez klucza API w logach
+            logger.debug("Sending request to %s with query: %s", self.api_url, query)
+            
+            async with session.post(self.api_url, json=payload) as response:
+                if response.status != 200:
+                    raise Exception(f"API error: {await response.text()}")
                 
-                print(f"Sending request to {self.api_url} with payload:", payload)
+                data = await response.json()
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("API Response: %s", json.dumps(data))
                 
-                async with session.post(self.api_url, json=payload) as response:
-                    if response.status != 200:
-                        raise Exception(f"API error: {await response.text()}")
-                    
-                    data = await response.json()
-                    print(f"API Response: {json.dumps(data, indent=2)}")
-                    
-                    # Wyciągnij dane z klucza 'reply'
-                    result = data.get('reply', [])
-                    print(f"Extracted data: {json.dumps(result, indent=2)}")
+                # Wyciągnij dane z klucza 'reply'
+                result = data.get('reply', [])
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Extracted data: %s", json.dumps(result))
+                
+                if isinstance(result, list):
+                    # Mapuj dane dla users
+                    if 'username' in result[0]:
+                        return [{'id': item['id'], 'name': item['username']} for item in result]
+                    # Mapuj dane dla connections
+                    elif 'user1_id' in result[0]:
+                        return [{'source_id': item['user1_id'], 'target_id': item['user2_id']} for item in result]
                     
-                    if isinstance(result, list):
-                        # Mapuj dane dla users
-                        if 'username' in result[0]:
-                            return [{'id': item['id'], 'name': item['username']} for item in result]
-                        # Mapuj dane dla connections
-                        elif 'user1_id' in result[0]:
-                            return [{'source_id': item['user1_id'], 'target_id': item['user2_id']} for item in result]
-                        
-                    return result
+                return result
         except Exception as e:
             print(f"Error fetching data: {str(e)}")
             raise
 
+    @staticmethod
+    def _count(tx, query: str) -> int:
+        """Run a count query inside a read transaction"""
+        return tx.run(query).single()["count"]
+
     @sync_to_async
     def _verify_database(self):
         """Verify database state"""
         with self.neo4j_driver.session() as session:
             # Sprawdź węzły
-            result = session.run("MATCH (n:User) RETURN count(n) as count")
-            node_count = result.single()["count"]
+            node_count = session.execute_read(
+                self._count, "MATCH (n:User) RETURN count(n) as count"
+            )
             print(f"Verified nodes in database: {node_count}")
             
             # Sprawdź relacje
-            result = session.run("MATCH ()-[r:KNOWS]->() RETURN count(r) as count")
-            rel_count = result.single()["count"]
+            rel_count = session.execute_read(
+                self._count, "MATCH ()-[r:KNOWS]->() RETURN count(r) as count"
+            )
             print(f"Verified relationships in database: {rel_count}")
 
     @sync_to_async
     def _clear_database(self):
         """Clear all nodes and relationships from Neo4j"""
         with self.neo4j_driver.session() as session:
-            session.run("MATCH (n) DETACH DELETE n")
+            session.execute_write(lambda tx: tx.run("MATCH (n) DETACH DELETE n").consume())
             print("Database cleared")
 
+    @staticmethod
+    def _normalize_id(value: Any) -> Any:
+        """Store numeric ids as integers so index lookups compare ints, not strings"""
+        text = str(value)
+        return int(text) if text.isdigit() else text
+
+    @staticmethod
+    def _write_batches(tx, query: str, rows: List[Dict[str, Any]], batch_size: int):
+        """Run UNWIND query over rows in sub-batches inside one transaction"""
+        for start in range(0, len(rows), batch_size):
+            tx.run(query, rows=rows[start:start + batch_size])
+
     @sync_to_async
     def _create_users(self, users: List[Dict[str, Any]]):
         """Create user nodes in Neo4j"""
-        with self.neo4j_driver.session() as session:
-            for user in users:
-                print(f"Processing user data: {user}")
-                try:
-                    # Obsługa różnych formatów danych
-                    if isinstance(user, (list, tuple)):
-                        user_id, name = user
-                    elif isinstance(user, dict):
-                        user_id = user.get('id')
-                        name = user.get('name')
-                    else:
-                        print(f"Unexpected user data format: {type(user)}")
-                        continue
-
-                    if user_id is not None and name is not None:
-                        print(f"Creating user node: id={user_id}, name={name}")
-                        session.run(
-                            "CREATE (u:User {id: $id, name: $name})",
-                            id=str(user_id), name=str(name)
-                        )
-                except Exception as e:
-                    print(f"Error creating user node: {str(e)}")
-                    raise
+        rows = []
+        for user in users:
+            logger.debug("Processing user data: %s", user)
+            # Obsługa różnych formatów danych
+            if isinstance(user, (list, tuple)):
+                user_id, name = user
+            elif isinstance(user, dict):
+                user_id = user.get('id')
+                name = user.get('name')
+            else:
+                print(f"Unexpected user data format: {type(user)}")
+                continue
 
-            # Create unique constraint on name
+            if user_id is not None and name is not None:
+                rows.append({'id': self._normalize_id(user_id), 'name': str(name)})
+
+        with self.neo4j_driver.session() as session:
             try:
-                session.run("CREATE CONSTRAINT user_name IF NOT EXISTS FOR (u:User) REQUIRE u.name IS UNIQUE")
+                print(f"Creating {len(rows)} user nodes")
+                session.execute_write(
+                    self._write_batches,
+                    "UNWIND $rows AS row CREATE (u:User {id: row.id, name: row.name})",
+                    rows,
+                    self.batch_size
+                )
             except Exception as e:
-                print(f"Warning: Constraint creation failed (might already exist): {str(e)}")
+                print(f"Error creating user nodes: {str(e)}")
+                raise
+
+            # Unique constraint on id backs the MATCH lookups in _create_connections,
+            # the one on name backs PathFinder's lookups by user name
+            for constraint in [
+                "CREATE CONSTRAINT user_id IF NOT EXISTS FOR (u:User) REQUIRE u.id IS UNIQUE",
+                "CREATE CONSTRAINT user_name IF NOT EXISTS FOR (u:User) REQUIRE u.name IS UNIQUE"
+            ]:
+                try:
+                    session.run(constraint)
+                except Exception as e:
+                    print(f"Warning: Constraint creation failed (might already exist): {str(e)}")
 
     @sync_to_async
     def _create_connections(self, connections: List[Dict[str, Any]]):
         """Create relationships between users in Neo4j"""
+        rows = []
+        for conn in connections:
+            logger.debug("Processing connection data: %s", conn)
+            # Obsługa różnych formatów danych
+            if isinstance(conn, (list, tuple)):
+                source_id, target_id = conn
+            elif isinstance(conn, dict):
+                source_id = conn.get('source_id')
+                target_id = conn.get('target_id')
+            else:
+                print(f"Unexpected connection data format: {type(conn)}")
+                continue
+
+            if source_id is not None and target_id is not None:
+                rows.append({
+                    'source_id': self._normalize_id(source_id),
+                    'target_id': self._normalize_id(target_id)
+                })
+
         with self.neo4j_driver.session() as session:
-            for conn in connections:
-                print(f"Processing connection data: {conn}")
-                try:
-                    # Obsługa różnych formatów danych
-                    if isinstance(conn, (list, tuple)):
-                        source_id, target_id = conn
-                    elif isinstance(conn, dict):
-                        source_id = conn.get('source_id')
-                        target_id = conn.get('target_id')
-                    else:
-                        print(f"Unexpected connection data format: {type(conn)}")
-                        continue
-
-                    if source_id is not None and target_id is not None:
-                        print(f"Creating relationship: {source_id} -> {target_id}")
-                        session.run("""
-                            MATCH (u1:User {id: $source_id})
-                            MATCH (u2:User {id: $target_id})
-                            CREATE (u1)-[:KNOWS]->(u2)
-                        """, source_id=str(source_id), target_id=str(target_id))
-                except Exception as e:
-                    print(f"Error creating relationship: {str(e)}")
-                    raise
+            try:
+                print(f"Creating {len(rows)} relationships")
+                session.execute_write(
+                    self._write_batches,
+                    """
+                    UNWIND $rows AS row
+                    MATCH (u1:User {id: row.source_id})
+                    MATCH (u2:User {id: row.target_id})
+                    CREATE (u1)-[:KNOWS]->(u2)
+                    """,
+                    rows,
+                    self.batch_size
+                )
+            except Exception as e:
+                print(f"Error creating relationships: {str(e)}")
+                raise
 
     async def index_data(self) -> Dict[str, Any]:
         """Main method to index data from MySQL to Neo4j"""
         try:
-            print("\n=== Fetching users data ===")
-            users_data = await self.fetch_data("SELECT * FROM users")
-            print(f"\nProcessed users data: {json.dumps(users_data, indent=2)}")
-            
-            print("\n=== Fetching connections data ===")
-            connections_data = await self.fetch_data("SELECT * FROM connections")
-            print(f"\nProcessed connections data: {json.dumps(connections_data, indent=2)}")
+            print("\n=== Fetching users and connections data ===")
+            users_data, connections_data = await asyncio.gather(
+                self.fetch_data("SELECT * FROM users"),
+                self.fetch_data("SELECT * FROM connections")
+            )
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Processed users data: %s", json.dumps(users_data))
+                logger.debug("Processed connections data: %s", json.dumps(connections_data))
             
             print(f"\nFound {len(users_data)} users and {len(connections_data)} connections")
             
@@ -157,6 +230,9 @@ class GraphIndexer:
             
             print("\n=== Verifying database state ===")
             await self._verify_database()
+
+            # Graf się zmienił - zapamiętane ścieżki są nieaktualne
+            await invalidate_path_cache()
             
             return {
                 "status": "success",
@@ -171,6 +247,14 @@ class GraphIndexer:
                 "message": str(e)
             }
 
+    async def aclose(self):
+        """Close shared HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
     def close(self):
-        """Close Neo4j driver connection"""
-        self.neo4j_driver.close() 
\ No newline at end of file
+        """
+        Kept for compatibility - the shared Neo4j driver is closed at process exit
+        """
+        pass 
\ No newline at end of file
@@ -1,5 +1,7 @@
 from typing import Dict, Any, BinaryIO
-import base64
+import os
+import asyncio
+import pybase64
 from ..base_processor import BaseProcessor
 from ..openai_client import OpenAIClient
 
@@ -32,8 +34,9 @@ class ImageAnalyzer(BaseProcessor):
         """
         Analyze image using GPT-4 Vision
         """
-        # Convert image to base64
-        image_base64 = base64.b64encode(image_data.read()).decode('utf-8')
+        # Read the stream off the event loop, then convert image to base64
+        raw_data = await asyncio.to_thread(image_data.read)
+        image_base64 = pybase64.b64encode(raw_data).decode('ascii')
         
         return await self.openai_client.chat_completion(
             prompt_key="image_analyze",
@@ -56,9 +59,12 @@ class ImageAnalyzer(BaseProcessor):
         if not image_data:
             return False
             
-        # Check file size
-        image_data.seek(0, 2)
-        size = image_data.tell()
-        image_data.seek(0)
+        # Check file size - fstat for real files, seek/tell for in-memory streams
+        try:
+            size = os.fstat(image_data.fileno()).st_size
+        except (AttributeError, OSError):
+            image_data.seek(0, 2)
+            size = image_data.tell()
+            image_data.seek(0)
         
         return size <= self.max_size 
\ No newline at end of file
@@ -1,5 +1,7 @@
 from typing import Dict, Any, BinaryIO
-import base64
+import os
+import weakref
+import pybase64
 from ..base_processor import BaseProcessor
 from ..openai_client import OpenAIClient
 
@@ -8,6 +10,8 @@ class ImageProcessor(BaseProcessor):
         self.openai_client = OpenAIClient()
         self.supported_formats = ['jpg', 'jpeg', 'png', 'webp']
         self.max_size = 20 * 1024 * 1024  # 20MB
+        # Encoded data URLs keyed by the stream they were read from
+        self._encoded = weakref.WeakKeyDictionary()
 
     async def process(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -34,11 +38,8 @@ class ImageProcessor(BaseProcessor):
         """
         Process image using GPT-4 Vision
         """
-        image_data = data.get("image")
-        image_base64 = base64.b64encode(image_data.read()).decode('utf-8')
-        
         return await self.openai_client.chat_completion_with_vision(
-            image_data=f"data:image/jpeg;base64,{image_base64}",
+            image_data=self._to_data_url(data.get("image")),
             prompt_key="image_vision_analyze",
             prompt_vars={}
         )
@@ -47,11 +48,8 @@ class ImageProcessor(BaseProcessor):
         """
         Extract text from image using GPT-4 Vision
         """
-        image_data = data.get("image")
-        image_base64 = base64.b64encode(image_data.read()).decode('utf-8')
-        
         return await self.openai_client.chat_completion_with_vision(
-            image_data=f"data:image/jpeg;base64,{image_base64}",
+            image_data=self._to_data_url(data.get("image")),
             prompt_key="image_analyze",
             prompt_vars={"image_description": "Focus on extracting and listing any text visible in this image."}
         )
@@ -73,6 +71,18 @@ class ImageProcessor(BaseProcessor):
             }
         )
 
+    def _to_data_url(self, image_data: BinaryIO) -> str:
+        """
+        Encode image stream as a data URL, reusing the result for the same stream
+        """
+        data_url = self._encoded.get(image_data)
+        if data_url is None:
+            image_data.seek(0)
+            image_base64 = pybase64.b64encode(image_data.read()).decode('ascii')
+            data_url = f"data:image/jpeg;base64,{image_base64}"
+            self._encoded[image_data] = data_url
+        return data_url
+
     def validate_input(self, image_data: BinaryIO) -> bool:
         """
         Validate image data
@@ -80,10 +90,13 @@ class ImageProcessor(BaseProcessor):
         if not image_data:
             return False
             
-        # Check file size
-        image_data.seek(0, 2)
-        size = image_data.tell()
-        image_data.seek(0)
+        # Check file size - fstat for real files, seek/tell for in-memory streams
+        try:
+            size = os.fstat(image_data.fileno()).st_size
+        except (AttributeError, OSError):
+            image_data.seek(0, 2)
+            size = image_data.tell()
+            image_data.seek(0)
         
         if size > self.max_size:
             return False
@@ -1,13 +1,20 @@
 from typing import Dict, Any, Optional
-import openai
+import httpx
+from openai import AsyncOpenAI
 from django.conf import settings
 from ..base_processor import BaseProcessor
 
 class LLMClient(BaseProcessor):
     def __init__(self):
         self.api_key = settings.OPENAI_API_KEY
-        openai.api_key = self.api_key
         self.default_model = "gpt-4o-mini"
+        # Persistent connection pool shared by all requests of this client
+        self._client = AsyncOpenAI(
+            api_key=self.api_key,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+            )
+        )
 
     async def process(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -33,7 +40,7 @@ class LLMClient(BaseProcessor):
         max_tokens: int = 150
     ) -> Dict[str, Any]:
         try:
-            response = await openai.ChatCompletion.acreate(
+            response = await self._client.chat.completions.create(
                 model=model or self.default_model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=temperature,
@@ -43,10 +50,16 @@ class LLMClient(BaseProcessor):
             return {
                 "status": "success",
                 "content": response.choices[0].message.content,
-                "usage": response.usage
+                "usage": response.usage.model_dump() if response.usage else None
             }
         except Exception as e:
             return {
                 "status": "error",
                 "error": str(e)
-            } 
\ No newline at end of file
+            }
+
+    async def close(self) -> None:
+        """
+        Close underlying HTTP connection pool
+        """
+        await self._client.close()
\ No newline at end of file
@@ -0,0 +1,56 @@
+import json
+from hashlib import blake2b
+from typing import Any, Dict, List, Optional
+from django.core.cache import cache
+from openai import AsyncOpenAI
+
+# Odpowiedzi z niską temperaturą są praktycznie deterministyczne - można je trzymać dobę
+CACHE_TTL = 60 * 60 * 24
+MAX_CACHED_TEMPERATURE = 0.3
+
+def _cache_key(
+    messages: List[Dict[str, Any]],
+    model: str,
+    temperature: float,
+    max_tokens: Optional[int],
+    response_format: Optional[Dict[str, Any]]
+) -> str:
+    """Build cache key from the full request"""
+    payload = json.dumps([messages, response_format], sort_keys=True, ensure_ascii=False)
+    digest = blake2b(
+        f"{model}\0{temperature}\0{max_tokens}\0{payload}".encode('utf-8'),
+        digest_size=32
+    )
+    return f"llm:{digest.hexdigest()}"
+
+async def cached_completion(
+    client: AsyncOpenAI,
+    messages: List[Dict[str, Any]],
+    model: str,
+    temperature: float,
+    max_tokens: Optional[int] = None,
+    response_format: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Get completion content, reusing earlier responses for identical low-temperature requests
+    """
+    params = {"model": model, "messages": messages, "temperature": temperature}
+    if max_tokens is not None:
+        params["max_tokens"] = max_tokens
+    if response_format is not None:
+        params["response_format"] = response_format
+
+    if temperature > MAX_CACHED_TEMPERATURE:
+        response = await client.chat.completions.create(**params)
+        return response.choices[0].message.content
+
+    key = _cache_key(messages, model, temperature, max_tokens, response_format)
+    content = await cache.aget(key)
+    if content is not None:
+        return content
+
+    response = await client.chat.completions.create(**params)
+    content = response.choices[0].message.content
+    if content is not None:
+        await cache.aset(key, content, CACHE_TTL)
+    return content
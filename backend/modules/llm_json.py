@@ -0,0 +1,19 @@
+import re
+from typing import Any, Optional
+import orjson
+
+# Otwierający ```lang i zamykający ``` wokół odpowiedzi modelu
+_FENCE_RE = re.compile(r'^```[a-zA-Z]*\s*\n|\n```\s*$')
+
+def parse_json_response(content: Optional[str]) -> Optional[Any]:
+    """Parse JSON model response, stripping accidental code fences if needed"""
+    if not content:
+        return None
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        pass
+    try:
+        return orjson.loads(_FENCE_RE.sub('', content.strip()))
+    except orjson.JSONDecodeError:
+        return None
@@ -0,0 +1,30 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Set
+
+logger = logging.getLogger(__name__)
+
+# Silne referencje - pętla trzyma zadania tylko przez słabe referencje
+_shutdown_tasks: Set[asyncio.Task] = set()
+
+async def _wait_for_shutdown(close: Callable[[], Awaitable[None]]) -> None:
+    """Sleep until cancelled, then close the resource while the loop still runs"""
+    try:
+        await asyncio.get_running_loop().create_future()
+    finally:
+        try:
+            await close()
+        except Exception as e:
+            logger.warning("Error closing loop-bound resource: %s", e)
+
+def close_on_loop_shutdown(close: Callable[[], Awaitable[None]]) -> None:
+    """
+    Run close() when the current event loop shuts down
+
+    asyncio.run and async_to_sync cancel all remaining tasks before closing
+    their loop, so a per-request loop releases its resources on exit, while
+    a long-lived ASGI loop keeps them for the whole process
+    """
+    task = asyncio.get_running_loop().create_task(_wait_for_shutdown(close))
+    _shutdown_tasks.add(task)
+    task.add_done_callback(_shutdown_tasks.discard)
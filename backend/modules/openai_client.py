@@ -1,51 +1,186 @@
-from typing import Dict, Any, Optional
-from openai import AsyncOpenAI
+import asyncio
+import atexit
+import functools
+import logging
+import mimetypes
+from typing import Dict, Any, List, Optional
+import aiofiles
+import httpx
+import orjson
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from django.conf import settings
 from .prompts.manager import PromptManager
+from .llm_cache import cached_completion
+from .loop_scope import close_on_loop_shutdown
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
+# Klient HTTP jest związany z pętlą zdarzeń, więc trzymamy jeden na pętlę;
+# w procesie ASGI oznacza to jeden klient (i jedną pulę połączeń) na cały proces
+_clients: Dict[Optional[asyncio.AbstractEventLoop], AsyncOpenAI] = {}
+_PROMPT_MANAGER = PromptManager()
+
+class _OrjsonHttpxClient(DefaultAsyncHttpxClient):
+    """HTTP client serializing JSON request bodies with orjson instead of stdlib json"""
+
+    def build_request(self, *args, json: Any = None, **kwargs) -> httpx.Request:
+        if json is not None and kwargs.get("content") is None and not kwargs.get("files"):
+            headers = httpx.Headers(kwargs.get("headers"))
+            headers.setdefault("Content-Type", "application/json")
+            kwargs["headers"] = headers
+            kwargs["content"] = orjson.dumps(json)
+            json = None
+        return super().build_request(*args, json=json, **kwargs)
+
+def get_client() -> AsyncOpenAI:
+    """Get AsyncOpenAI client shared by all callers on the current event loop"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    client = _clients.get(loop)
+    if client is None:
+        # Zwolnij klientów pętli, które już zostały zamknięte
+        for stale in [l for l in _clients if l is not None and l.is_closed()]:
+            del _clients[stale]
+        client = _clients[loop] = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            # Ponawianiem zajmuje się openai_retry - bez tego próby SDK mnożyłyby się z naszymi
+            max_retries=0,
+            # Domyślna pula httpx (100 połączeń) staje się wąskim gardłem przy
+            # wielu równoległych zapytaniach - podnosimy limity; HTTP/2 multipleksuje
+            # zapytania do api.openai.com na utrzymywanych połączeniach
+            http_client=_OrjsonHttpxClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=500, max_keepalive_connections=200)
+            )
+        )
+        if loop is not None:
+            # Pętle z async_to_sync/asyncio.run żyją jedno żądanie - pulę zamykamy razem z nimi
+            close_on_loop_shutdown(client.close)
+    return client
+
+# Limit równoległych zapytań chat.completions na pętlę - chroni przed rate limitami,
+# gdy wiele zadań rozchodzi się naraz przez gather
+MAX_CONCURRENT_COMPLETIONS = 50
+_semaphores: Dict[Optional[asyncio.AbstractEventLoop], asyncio.Semaphore] = {}
+
+def get_completion_semaphore() -> asyncio.Semaphore:
+    """Get semaphore limiting concurrent chat completions on the current event loop"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        for stale in [l for l in _semaphores if l is not None and l.is_closed()]:
+            del _semaphores[stale]
+        semaphore = _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENT_COMPLETIONS)
+    return semaphore
+
+@atexit.register
+def _close_clients() -> None:
+    """Close pooled connections of clients whose loop is still open but no longer running"""
+    for loop, client in list(_clients.items()):
+        if loop is not None and not loop.is_closed() and not loop.is_running():
+            loop.run_until_complete(client.close())
+    _clients.clear()
+
+# Ponawianie przy zerwanym połączeniu, rate limitach i błędach serwera: 1s, 2s, 4s
+# (klient SDK ma wyłączone własne ponawianie)
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 1.0
+_RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+def openai_retry(fn):
+    """Retry transient OpenAI errors with exponential backoff, re-raising the last one"""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                return await fn(*args, **kwargs)
+            except _RETRYABLE_ERRORS as e:
+                if attempt == MAX_RETRIES:
+                    logger.error("Error in %s after %d retries: %s", fn.__name__, MAX_RETRIES, e)
+                    raise
+                delay = RETRY_BASE_DELAY * 2 ** attempt
+                logger.warning("%s failed (%s), retrying in %.0fs", fn.__name__, type(e).__name__, delay)
+                await asyncio.sleep(delay)
+    return wrapper
+
+def openai_safe(fn):
+    """
+    Retry transient OpenAI errors with exponential backoff and turn any
+    remaining exception into an error result
+    """
+    retrying = openai_retry(fn)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await retrying(*args, **kwargs)
+        except _RETRYABLE_ERRORS as e:
+            return {"status": "error", "error": str(e)}
+        except Exception as e:
+            logger.error("Error in %s (%s): %s", fn.__name__, type(e).__name__, e)
+            return {"status": "error", "error": str(e)}
+    return wrapper
+
+_BATCH_FINAL_STATUSES = frozenset({"completed", "failed", "expired", "cancelled"})
+
 class OpenAIClient:
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-        self.prompt_manager = PromptManager()
+        self.prompt_manager = _PROMPT_MANAGER
 
+    @property
+    def client(self) -> AsyncOpenAI:
+        return get_client()
+
+    @openai_safe
     async def chat_completion(
         self,
-        messages: list,
+        *,
+        messages: Optional[List[Dict[str, Any]]] = None,
+        prompt_key: Optional[str] = None,
+        prompt_vars: Optional[Dict[str, Any]] = None,
         model: str = "gpt-4o",
-        temperature: float = 0.5
+        temperature: float = 0.5,
+        max_tokens: Optional[int] = None,
+        response_format: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
-        Get completion from ChatGPT
+        Get completion from ChatGPT, either for ready messages or for a
+        PromptManager template sent as a single user message
         """
-        try:
-            print("\n=== OpenAI Request ===")
-            print(f"Model: {model}")
-            print(f"Temperature: {temperature}")
-            print("Messages:")
+        if messages is None:
+            if prompt_key is None:
+                raise ValueError("Either messages or prompt_key is required")
+            prompt = self.prompt_manager.get_prompt(prompt_key, **(prompt_vars or {}))
+            messages = [{"role": "user", "content": prompt}]
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("OpenAI request: model=%s temperature=%s", model, temperature)
             for msg in messages:
-                print(f"[{msg['role']}]: {msg['content'][:200]}...")  # Pokazujemy pierwsze 200 znaków
+                # Pokazujemy pierwsze 200 znaków
+                logger.debug("[%s]: %s...", msg['role'], str(msg['content'])[:200])
 
-            response = await self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=temperature
+        async with get_completion_semaphore():
+            content = await cached_completion(
+                self.client, messages, model, temperature, max_tokens, response_format
             )
 
-            print("\n=== OpenAI Response ===")
-            print(f"Raw response object: {response}")
-            print(f"First choice content: {response.choices[0].message.content}")
+        logger.debug("OpenAI response content: %s", content)
 
-            return {
-                "status": "success",
-                "content": response.choices[0].message.content
-            }
-        except Exception as e:
-            print(f"\n=== OpenAI Error ===")
-            print(f"Error type: {type(e)}")
-            print(f"Error message: {str(e)}")
-            return {"status": "error", "error": str(e)}
+        return {
+            "status": "success",
+            "content": content
+        }
 
+    @openai_safe
     async def generate_image(
         self,
         prompt_vars: Dict[str, Any],
@@ -56,22 +191,20 @@ class OpenAIClient:
         """
         Generate image using DALL-E
         """
-        try:
-            prompt = self.prompt_manager.get_prompt("image_generate", **prompt_vars)
-            response = await self.client.images.generate(
-                prompt=prompt,
-                size=size,
-                quality=quality,
-                model=model,
-                n=1
-            )
-            return {
-                "status": "success",
-                "url": response.data[0].url
-            }
-        except Exception as e:
-            return {"status": "error", "error": str(e)}
+        prompt = self.prompt_manager.get_prompt("image_generate", **prompt_vars)
+        response = await self.client.images.generate(
+            prompt=prompt,
+            size=size,
+            quality=quality,
+            model=model,
+            n=1
+        )
+        return {
+            "status": "success",
+            "url": response.data[0].url
+        }
 
+    @openai_safe
     async def transcribe_audio(
         self,
         audio_file,
@@ -80,21 +213,21 @@ class OpenAIClient:
         """
         Transcribe audio using Whisper
         """
-        try:
-            print(f"Attempting to transcribe file: {audio_file}")
-            response = await self.client.audio.transcriptions.create(
-                model=model,
-                file=audio_file
-            )
-            print(f"Got response: {response}")
-            return {
-                "status": "success",
-                "text": response.text
-            }
-        except Exception as e:
-            print(f"Error in transcribe_audio: {e}")
-            return {"status": "error", "error": str(e)}
+        logger.debug("Attempting to transcribe file: %s", audio_file)
+        # Przy ponowieniu plik musi być wysłany od początku
+        if hasattr(audio_file, 'seek'):
+            audio_file.seek(0)
+        response = await self.client.audio.transcriptions.create(
+            model=model,
+            file=audio_file
+        )
+        logger.debug("Got transcription response: %s", response)
+        return {
+            "status": "success",
+            "text": response.text
+        }
 
+    @openai_safe
     async def chat_completion_with_vision(
         self,
         image_data: str,
@@ -103,55 +236,181 @@ class OpenAIClient:
         model: str = "gpt-4o-mini"
     ) -> Dict[str, Any]:
         """Get completion from GPT-4 Vision"""
-        try:
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Opisz co widzisz na tym zdjęciu."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": image_data}
-                        }
-                    ]
-                }
-            ]
-            
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": "Opisz co widzisz na tym zdjęciu."
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": image_data}
+                    }
+                ]
+            }
+        ]
+        
+        async with get_completion_semaphore():
             response = await self.client.chat.completions.create(
                 model=model,
                 messages=messages,
                 max_tokens=500
             )
-            
-            return {
-                "status": "success",
-                "content": response.choices[0].message.content
+        
+        return {
+            "status": "success",
+            "content": response.choices[0].message.content
+        }
+
+    @openai_safe
+    async def chat_completion_with_audio(
+        self,
+        audio_data: str,
+        prompt_key: str,
+        prompt_vars: Dict[str, Any],
+        audio_format: str = "wav",
+        model: str = "gpt-4o-audio-preview"
+    ) -> Dict[str, Any]:
+        """Get completion for base64 encoded audio in a single call, without separate transcription"""
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "input_audio",
+                        "input_audio": {"data": audio_data, "format": audio_format}
+                    },
+                    {
+                        "type": "text",
+                        "text": self.prompt_manager.get_prompt(prompt_key, **prompt_vars)
+                    }
+                ]
             }
-        except Exception as e:
-            return {"status": "error", "error": str(e)}
+        ]
+
+        async with get_completion_semaphore():
+            response = await self.client.chat.completions.create(
+                model=model,
+                modalities=["text"],
+                messages=messages
+            )
+
+        return {
+            "status": "success",
+            "content": response.choices[0].message.content
+        }
+
+    @openai_retry
+    async def submit_batch(self, requests: List[Dict[str, Any]]) -> str:
+        """
+        Submit chat completion requests as an offline Batch API job
+
+        Args:
+            requests: Items with "custom_id" and "body" (chat completion parameters)
+
+        Returns:
+            str: Batch id to poll with fetch_batch
+        """
+        lines = b"\n".join(
+            orjson.dumps({
+                "custom_id": request["custom_id"],
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": request["body"]
+            })
+            for request in requests
+        )
+        input_file = await self.client.files.create(
+            file=("batch.jsonl", lines),
+            purpose="batch"
+        )
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        logger.debug("Submitted batch %s with %d requests", batch.id, len(requests))
+        return batch.id
+
+    @openai_retry
+    async def fetch_batch(
+        self,
+        batch_id: str,
+        initial_delay: float = 5.0,
+        max_delay: float = 300.0
+    ) -> Dict[str, Any]:
+        """
+        Poll Batch API job until it finishes, backing off exponentially
+
+        Returns:
+            Dict with status and, for completed jobs, response content by custom_id
+        """
+        delay = initial_delay
+        while True:
+            batch = await self.client.batches.retrieve(batch_id)
+            if batch.status in _BATCH_FINAL_STATUSES:
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+        if batch.status != "completed" or not batch.output_file_id:
+            return {"status": "error", "error": f"Batch {batch_id} ended with status {batch.status}"}
+
+        output = await self.client.files.content(batch.output_file_id)
+        results = {}
+        for line in output.content.splitlines():
+            if not line:
+                continue
+            item = orjson.loads(line)
+            response = item.get("response") or {}
+            if response.get("status_code") == 200:
+                results[item["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+            else:
+                results[item["custom_id"]] = None
 
-    def transcribe_audio(self, audio_file_path: str | Path) -> str:
+        return {"status": "success", "results": results}
+
+    @openai_retry
+    async def transcribe_audio_file(
+        self,
+        audio_file_path: str | Path,
+        model: str = "whisper-1"
+    ) -> str:
         """
         Transcribes audio file using OpenAI Whisper model.
         
         Args:
             audio_file_path: Path to the audio file
+            model: Transcription model
         
         Returns:
             str: Transcribed text from the audio file
         """
         audio_path = Path(audio_file_path)
-        if not audio_path.exists():
+        if not await asyncio.to_thread(audio_path.is_file):
             raise FileNotFoundError(f"Audio file not found at: {audio_path}")
         
-        with open(audio_path, "rb") as audio_file:
-            transcript = self.client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file
-            )
+        # Odczyt bez blokowania pętli zdarzeń
+        async with aiofiles.open(audio_path, "rb") as audio_file:
+            data = await audio_file.read()
+
+        content_type = mimetypes.guess_type(audio_path.name)[0] or "audio/mpeg"
+        transcript = await self.client.audio.transcriptions.create(
+            model=model,
+            file=(audio_path.name, data, content_type)
+        )
         
         return transcript.text
-        
\ No newline at end of file
+
+# OpenAIClient nie trzyma stanu związanego z pętlą (AsyncOpenAI pobiera z get_client),
+# więc jedna instancja może obsługiwać cały proces
+_SINGLETON: Optional[OpenAIClient] = None
+
+def get_openai_client() -> OpenAIClient:
+    """Get OpenAIClient shared by the whole process"""
+    global _SINGLETON
+    if _SINGLETON is None:
+        _SINGLETON = OpenAIClient()
+    return _SINGLETON
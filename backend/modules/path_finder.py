@@ -1,38 +1,95 @@
 import aiohttp
+import asyncio
+import atexit
+import logging
 from typing import Dict, List, Optional
 from django.conf import settings
-from neo4j import GraphDatabase
-from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from neo4j import AsyncDriver, AsyncGraphDatabase
 from .base_reporter import BaseReporter
+from .loop_scope import close_on_loop_shutdown
 
-class PathFinder:
-    def __init__(self):
-        self.neo4j_driver = GraphDatabase.driver(
+logger = logging.getLogger(__name__)
+
+# Async driver jest związany z pętlą zdarzeń, więc trzymamy jeden na pętlę;
+# w procesie ASGI oznacza to jedną pulę połączeń Bolt dla wszystkich PathFinderów
+_drivers: Dict[asyncio.AbstractEventLoop, AsyncDriver] = {}
+
+def get_driver() -> AsyncDriver:
+    """Get async Neo4j driver shared by all PathFinder instances on the current event loop"""
+    loop = asyncio.get_running_loop()
+    driver = _drivers.get(loop)
+    if driver is None:
+        # Zwolnij drivery pętli, które już zostały zamknięte
+        for stale in [l for l in _drivers if l.is_closed()]:
+            del _drivers[stale]
+        driver = _drivers[loop] = AsyncGraphDatabase.driver(
             settings.NEO4J_CONFIG['URI'],
             auth=(settings.NEO4J_CONFIG['USERNAME'], settings.NEO4J_CONFIG['PASSWORD'])
         )
+        # Pętle z async_to_sync/asyncio.run żyją jedno żądanie - driver zamykamy razem z nimi
+        close_on_loop_shutdown(driver.close)
+    return driver
+
+@atexit.register
+def _close_drivers() -> None:
+    """Close drivers of loops that are still open but no longer running"""
+    for loop, driver in list(_drivers.items()):
+        if not loop.is_closed() and not loop.is_running():
+            loop.run_until_complete(driver.close())
+    _drivers.clear()
+
+# Graf zmienia się tylko przy ponownym indeksowaniu - GraphIndexer podbija wersję,
+# co unieważnia wszystkie zapamiętane ścieżki
+PATH_CACHE_TTL = 60 * 60
+PATH_CACHE_VERSION_KEY = "pf:version"
+
+async def invalidate_path_cache() -> None:
+    """Drop cached paths after the graph has been rebuilt"""
+    try:
+        await cache.aincr(PATH_CACHE_VERSION_KEY)
+    except ValueError:
+        await cache.aset(PATH_CACHE_VERSION_KEY, 1, None)
+
+class PathFinder:
+    def __init__(self):
         self.reporter = BaseReporter()
 
-    @sync_to_async
-    def find_shortest_path(self, start_name: str, end_name: str) -> Optional[List[str]]:
-        """Find shortest path between two users by their names"""
+    @property
+    def neo4j_driver(self) -> AsyncDriver:
+        return get_driver()
+
+    async def find_shortest_path(self, start_name: str, end_name: str) -> Optional[List[str]]:
+        """Find shortest path between two users by their names, reusing cached results"""
+        version = await cache.aget(PATH_CACHE_VERSION_KEY, 0)
+        key = f"pf:{start_name}:{end_name}"
+        path = await cache.aget(key, version=version)
+        if path is None:
+            path = await self._query_shortest_path(start_name, end_name)
+            # Nie zapamiętujemy braku ścieżki - mógł wynikać z błędu zapytania
+            if path is not None:
+                await cache.aset(key, path, PATH_CACHE_TTL, version=version)
+        return path
+
+    async def _query_shortest_path(self, start_name: str, end_name: str) -> Optional[List[str]]:
+        """Run shortest path query against Neo4j"""
         try:
-            with self.neo4j_driver.session() as session:
+            async with self.neo4j_driver.session() as session:
                 # Cypher query to find shortest path
-                result = session.run("""
+                result = await session.run("""
                     MATCH path = shortestPath(
                         (start:User {name: $start_name})-[:KNOWS*]-(end:User {name: $end_name})
                     )
                     RETURN [node in nodes(path) | node.name] as names
                 """, start_name=start_name, end_name=end_name)
                 
-                record = result.single()
+                record = await result.single()
                 if record:
                     return record["names"]
                 return None
                 
         except Exception as e:
-            print(f"Error finding path: {str(e)}")
+            logger.error("Error finding path: %s", e)
             return None
 
     async def process(self) -> Dict[str, str]:
@@ -49,7 +106,7 @@ class PathFinder:
             
             # Convert path to comma-separated string
             path_string = ", ".join(path)
-            print(f"Found path: {path_string}")
+            logger.debug("Found path: %s", path_string)
             
             # Send report
             await self.reporter.send_report("connections", path_string)
@@ -60,12 +117,17 @@ class PathFinder:
             }
             
         except Exception as e:
-            print(f"Error in process: {str(e)}")
+            logger.error("Error in process: %s", e)
             return {
                 "status": "error",
                 "message": str(e)
             }
+        finally:
+            await self.reporter.aclose()
 
-    def close(self):
-        """Close Neo4j driver connection"""
-        self.neo4j_driver.close() 
\ No newline at end of file
+    async def close(self):
+        """
+        Kept for compatibility - the shared Neo4j driver stays open for other
+        PathFinder instances and is closed when its event loop shuts down
+        """
+        pass 
\ No newline at end of file
@@ -55,18 +55,20 @@ class PromptManager:
                 required_vars=["transcription"]
             ),
         }
+        # Prekomputowane formatery i zbiory wymaganych zmiennych - get_prompt to tylko lookup
+        self._fmt = {key: prompt.template.format_map for key, prompt in self.prompts.items()}
+        self._required = {key: frozenset(prompt.required_vars) for key, prompt in self.prompts.items()}
     
     def get_prompt(self, prompt_key: str, **kwargs) -> str:
         """
         Get formatted prompt by key
         """
-        if prompt_key not in self.prompts:
+        fmt = self._fmt.get(prompt_key)
+        if fmt is None:
             raise KeyError(f"Prompt key '{prompt_key}' not found")
-            
-        prompt_template = self.prompts[prompt_key]
-        missing_vars = [var for var in prompt_template.required_vars if var not in kwargs]
-        
+
+        missing_vars = self._required[prompt_key] - kwargs.keys()
         if missing_vars:
-            raise ValueError(f"Missing required variables: {missing_vars}")
+            raise ValueError(f"Missing required variables: {sorted(missing_vars)}")
             
-        return prompt_template.template.format(**kwargs) 
\ No newline at end of file
+        return fmt(kwargs)
\ No newline at end of file
@@ -1,11 +1,17 @@
+import asyncio
+import os
+import pybase64
 from typing import Dict, Any, BinaryIO
 from ..base_processor import BaseProcessor
 from ..openai_client import OpenAIClient
 
 class AudioProcessor(BaseProcessor):
+    supported_formats = frozenset({'mp3', 'mp4', 'mpeg', 'mpga', 'm4a', 'wav', 'webm'})
+    # Formaty, które model audio przyjmuje bezpośrednio jako input_audio
+    fused_formats = frozenset({'wav', 'mp3'})
+
     def __init__(self):
         self.openai_client = OpenAIClient()
-        self.supported_formats = ['mp3', 'mp4', 'mpeg', 'mpga', 'm4a', 'wav', 'webm']
         self.max_size = 25 * 1024 * 1024  # 25MB (OpenAI's limit)
 
     async def process(self, data: Dict[str, Any]) -> Dict[str, Any]:
@@ -19,6 +25,12 @@ class AudioProcessor(BaseProcessor):
             return {"error": "Invalid audio data"}
 
         if operation == "transcribe":
+            # Opt-in: jedno wywołanie modelu audio zamiast transkrypcji + analizy
+            audio_format = self._audio_format(audio_data)
+            if data.get("fused") and audio_format in self.fused_formats:
+                audio_bytes = await asyncio.to_thread(audio_data.read)
+                return await self.process_audio_fused(audio_bytes, audio_format)
+
             result = await self.transcribe_audio(audio_data)
             if result["status"] == "success":
                 # Analyze the transcription
@@ -34,6 +46,28 @@ class AudioProcessor(BaseProcessor):
         """
         return await self.openai_client.transcribe_audio(audio_file)
 
+    async def process_audio_fused(self, audio_bytes: bytes, audio_format: str = "wav") -> Dict[str, Any]:
+        """
+        Analyze audio with a single multimodal call, skipping the separate transcription
+        """
+        result = await self.openai_client.chat_completion_with_audio(
+            audio_data=pybase64.b64encode(audio_bytes).decode('ascii'),
+            prompt_key="audio_analyze",
+            prompt_vars={"transcription": ""},
+            audio_format=audio_format
+        )
+        if result["status"] == "success":
+            result["analysis"] = result.pop("content")
+        return result
+
+    @staticmethod
+    def _audio_format(audio_data: BinaryIO) -> str:
+        """Get audio format from file name extension"""
+        name = getattr(audio_data, 'name', None)
+        if not isinstance(name, str):
+            return ""
+        return os.path.splitext(name)[1].lstrip('.').lower()
+
     async def analyze_transcription(self, transcription: str) -> Dict[str, Any]:
         """
         Analyze transcribed text using GPT
@@ -50,12 +84,24 @@ class AudioProcessor(BaseProcessor):
         if not audio_data:
             return False
             
-        # Check file size
-        audio_data.seek(0, 2)  # Seek to end
-        size = audio_data.tell()
-        audio_data.seek(0)  # Reset position
-        
-        if size > self.max_size:
-            return False
+        # Fast reject on extension, before touching the file
+        if isinstance(getattr(audio_data, 'name', None), str):
+            if self._audio_format(audio_data) not in self.supported_formats:
+                return False
             
-        return True 
\ No newline at end of file
+        # Check file size - fstat for real files, buffer length for BytesIO,
+        # seek/tell for other streams
+        try:
+            size = os.fstat(audio_data.fileno()).st_size
+        except (AttributeError, OSError):
+            size = None
+        if size is None and hasattr(audio_data, 'getbuffer'):
+            # Zwalniamy widok od razu - niezwolniony blokuje zmianę rozmiaru BytesIO
+            with audio_data.getbuffer() as buffer:
+                size = buffer.nbytes
+        if size is None:
+            audio_data.seek(0, 2)  # Seek to end
+            size = audio_data.tell()
+            audio_data.seek(0)  # Reset position
+        
+        return size <= self.max_size
\ No newline at end of file
@@ -0,0 +1,111 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import TestCase
+
+from core.models import FileAnalysis
+from modules import file_analyzer
+from modules.file_analyzer import FileAnalyzer, hash_file
+
+
+class FileAnalyzerTestCase(TestCase):
+    def setUp(self):
+        self.analyzer = FileAnalyzer()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.analyzer.data_dir = self.tmp_dir.name
+
+        # Liczymy wywołania analizy, nie zmieniając jej wyniku
+        self.analyzed = []
+        analyze_one = self.analyzer._analyze_one
+
+        async def counting(filename, file_path, extension):
+            self.analyzed.append(filename)
+            return await analyze_one(filename, file_path, extension)
+
+        self.analyzer._analyze_one = counting
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+
+class AnalyzeFilesTests(FileAnalyzerTestCase):
+    async def test_identical_files_are_analyzed_once(self):
+        self.write('a.txt', 'same report')
+        self.write('b.txt', 'same report')
+        self.write('c.txt', 'other report')
+
+        results = await self.analyzer._analyze_files()
+
+        self.assertEqual(
+            results,
+            [('a.txt', 'same report'), ('b.txt', 'same report'), ('c.txt', 'other report')]
+        )
+        self.assertEqual(self.analyzed, ['a.txt', 'c.txt'])
+        hashes = {
+            analysis.file_name: analysis.content_hash
+            async for analysis in FileAnalysis.objects.all()
+        }
+        self.assertEqual(hashes['a.txt'], hashes['b.txt'])
+        self.assertNotEqual(hashes['a.txt'], hashes['c.txt'])
+
+    async def test_content_cached_under_other_name_is_reused(self):
+        path = self.write('new.txt', 'known report')
+        await FileAnalysis.objects.acreate(
+            file_name='old.txt',
+            file_type='txt',
+            content='cached description',
+            content_hash=hash_file(path)
+        )
+
+        results = await self.analyzer._analyze_files()
+
+        self.assertEqual(results, [('new.txt', 'cached description')])
+        self.assertEqual(self.analyzed, [])
+
+    async def test_unreadable_file_is_skipped(self):
+        broken = self.write('broken.txt', 'unreadable')
+        self.write('ok.txt', 'fine')
+
+        def failing_hash(file_path):
+            if file_path == broken:
+                raise PermissionError(13, 'Permission denied', file_path)
+            return hash_file(file_path)
+
+        with mock.patch.object(file_analyzer, 'hash_file', side_effect=failing_hash):
+            results = await self.analyzer._analyze_files()
+
+        self.assertEqual(results, [('ok.txt', 'fine')])
+        self.assertEqual(self.analyzed, ['ok.txt'])
+        self.assertFalse(await FileAnalysis.objects.filter(file_name='broken.txt').aexists())
+
+
+class BulkUpsertTests(FileAnalyzerTestCase):
+    async def test_upsert_updates_existing_row_without_duplicates(self):
+        await FileAnalysis.objects.acreate(
+            file_name='a.txt',
+            file_type='txt',
+            content='old',
+            content_hash='old-hash',
+            category='people',
+            raw_content=b'raw'
+        )
+
+        await self.analyzer._bulk_upsert([
+            FileAnalysis(file_name='a.txt', file_type='txt', content='new', content_hash='new-hash'),
+            FileAnalysis(file_name='b.txt', file_type='txt', content='fresh', content_hash='b-hash'),
+        ])
+
+        self.assertEqual(await FileAnalysis.objects.acount(), 2)
+        updated = await FileAnalysis.objects.aget(file_name='a.txt')
+        self.assertEqual(updated.content, 'new')
+        self.assertEqual(updated.content_hash, 'new-hash')
+        # Nowa analiza treści unieważnia poprzednią kategorię
+        self.assertIsNone(updated.category)
+        # raw_content nie jest częścią upsertu
+        self.assertEqual(bytes(updated.raw_content), b'raw')
+        self.assertEqual((await FileAnalysis.objects.aget(file_name='b.txt')).content, 'fresh')
@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from core.models import Document
+from modules.web_crawler import WebCrawlerProcessor, purge_stale_documents
+
+
+class ReplaceMediaTagsTests(SimpleTestCase):
+    def _replace(self, markdown, link, replacement="DESC"):
+        patterns = WebCrawlerProcessor._audio_tag_patterns(link)
+        return WebCrawlerProcessor._replace_media_tags(
+            markdown, [(regex, replacement) for regex in patterns]
+        )
+
+    def test_audio_match_does_not_span_other_tags(self):
+        markdown = (
+            '<audio controls></audio>\n\nIMPORTANT PARAGRAPH\n\n'
+            '<audio><source src="b.mp3"></audio>'
+        )
+        self.assertEqual(
+            self._replace(markdown, "b.mp3"),
+            '<audio controls></audio>\n\nIMPORTANT PARAGRAPH\n\nDESC'
+        )
+
+    def test_audio_with_src_attribute(self):
+        self.assertEqual(
+            self._replace('before <audio src="b.mp3" controls></audio> after', "b.mp3"),
+            'before DESC after'
+        )
+
+    def test_source_match_stays_within_tag(self):
+        markdown = '<source src="a.mp3">\ntext\n<source src="b.mp3" type="audio/mpeg">'
+        self.assertEqual(
+            self._replace(markdown, "b.mp3"),
+            '<source src="a.mp3">\ntext\nDESC'
+        )
+
+    def test_all_patterns_replaced_in_one_pass(self):
+        tag_replacements = [
+            (regex, f"DESC-{name}")
+            for name in ("a", "b")
+            for regex in WebCrawlerProcessor._audio_tag_patterns(f"{name}.mp3")
+        ]
+        markdown = '<audio src="a.mp3"></audio>\nmiddle\n<source src="b.mp3">'
+        self.assertEqual(
+            WebCrawlerProcessor._replace_media_tags(markdown, tag_replacements),
+            'DESC-a\nmiddle\nDESC-b'
+        )
+
+    def test_no_patterns_returns_input(self):
+        self.assertEqual(WebCrawlerProcessor._replace_media_tags("text", []), "text")
+
+
+class ErrorDocumentTests(TestCase):
+    def setUp(self):
+        self.crawler = WebCrawlerProcessor()
+
+    async def test_save_document_flags_error_content(self):
+        document = await self.crawler._save_document(
+            "https://example.com/a", "page content", "filtered_html failed"
+        )
+        self.assertTrue(document.has_error)
+
+    async def test_save_document_skips_error_message(self):
+        self.assertIsNone(
+            await self.crawler._save_document("https://example.com/a", "Error: cannot access page")
+        )
+        self.assertFalse(await Document.objects.aexists())
+
+    def test_get_document_rejects_error_page(self):
+        Document.objects.create(
+            url="https://example.com/a",
+            original_content="page",
+            processed_content="Error 404",
+            has_error=True
+        )
+        self.assertIsNone(self.crawler._get_document("https://example.com/a"))
+        self.assertFalse(Document.objects.exists())
+
+    def test_get_document_returns_valid_page(self):
+        Document.objects.create(
+            url="https://example.com/a",
+            original_content="page",
+            processed_content="content"
+        )
+        self.assertIsNotNone(self.crawler._get_document("https://example.com/a"))
+
+    def test_purge_stale_documents(self):
+        Document.objects.create(url="https://example.com/ok", original_content="a", processed_content="b")
+        Document.objects.create(
+            url="https://example.com/error", original_content="a", processed_content="b", has_error=True
+        )
+        Document.objects.create(url="https://example.com/empty", original_content="a", processed_content="")
+        expired = Document.objects.create(url="https://example.com/old", original_content="a", processed_content="b")
+        Document.objects.filter(pk=expired.pk).update(created_at=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(purge_stale_documents(timedelta(hours=24)), 3)
+        self.assertEqual(
+            list(Document.objects.values_list("url", flat=True)),
+            ["https://example.com/ok"]
+        )
@@ -1,6 +1,104 @@
-from typing import Dict, Any
+from typing import Dict, Any, Final, List, Optional
 from ..base_processor import BaseProcessor
 from ..openai_client import OpenAIClient
+from ..llm_json import parse_json_response
+
+# Stały, identyczny przy każdym wywołaniu pierwszy komunikat - łapie się na
+# automatyczny prompt caching OpenAI (>1024 tokenów)
+_SINGLE_TAG_SYSTEM_PROMPT: Final[str] = """
+[Content Tagging and Analysis System]
+
+This prompt supports structured analysis and tagging of text content based on user-defined criteria. It ensures a clear, structured response in JSON format, providing reasoning for the chosen tag.
+
+Prompt Structure
+Objective:
+To analyze and tag text content based on user-provided criteria, assigning a single, most appropriate tag and explaining the reasoning behind the decision.
+Rules:
+Always Assign One Tag: The AI must assign one and only one tag from the provided list. If none of the tags fit, assign "other."
+No Guesswork: The AI must not guess or create new tags under any circumstances.
+Context Isolation: Analyze only the text provided by the user without considering external knowledge or context.
+Reasoning Field: Always include a reasoning field in the output that explains:
+Key elements identified in the text.
+Why the chosen tag is the most appropriate.
+Output Format: Responses must strictly adhere to this JSON format:
+{
+"data": {
+    "tags": ["chosen_tag"],
+    "reasoning": "Detailed explanation of the reasoning process, including key elements identified in the text, and why the tag was chosen."
+}
+}
+Examples:
+Example 1: Typical instruction
+
+USER: Determine whether the described subject is a human, an animal, or something else.
+TEXT: Golden retrievers are known for their gentle nature, loyalty, and intelligence. They are often used as guide dogs.
+ASSISTANT:
+{
+"data": {
+    "tags": ["animal"],
+    "reasoning": "The text describes a 'golden retriever,' explicitly identifying it as a dog, which fits the 'animal' category."
+}
+}
+Example 2: No match
+
+USER: Does this description refer to a human, an animal, or a machine?
+TEXT: A cactus is a desert plant that stores water in its stems.
+ASSISTANT:
+{
+"data": {
+    "tags": ["other"],
+    "reasoning": "The text describes a 'cactus,' which does not match the provided tags (human, animal, or machine). Therefore, the 'other' tag is assigned."
+}
+}
+Example 3: Abstract concept
+
+USER: Assign one tag: human, animal, sport, or food.
+TEXT: Apples are a popular fruit, rich in vitamins, often enjoyed as a healthy snack.
+ASSISTANT:
+{
+"data": {
+    "tags": ["food"],
+    "reasoning": "The text centers around 'apples,' which are described as food. This directly aligns with the 'food' tag."
+}
+}
+Example 4: Edge case (Insufficient information)
+
+USER: Assign a tag: human, animal, plant, machine, or other.
+TEXT: Friendship is one of the most important aspects of life.
+ASSISTANT:
+{
+"data": {
+    "tags": ["other"],
+    "reasoning": "The text describes an abstract concept ('friendship') and does not correspond to any of the provided tags. Therefore, the 'other' tag is assigned."
+}
+}
+Example 5: Complex text with multiple elements
+
+USER: Categorize the description based on whether it refers to humans, animals, food, sports, or robots.
+TEXT: John Smith is a robotics engineer passionate about designing autonomous machines and artificial intelligence. In his free time, he enjoys walking his Labrador, Max, and jogging in nearby parks to stay fit. His favorite dish is homemade lasagna, which he often prepares for his family after a day of working on new technology projects.
+ASSISTANT:
+{
+"data": {
+    "tags": ["human"],
+    "reasoning": "The text primarily focuses on John Smith, a robotics engineer. While other tags (e.g., 'animal' for the dog or 'food' for lasagna) are mentioned, they serve as supporting details, not the central subject."
+}
+}
+"""
+
+_SINGLE_TAG_BATCH_INSTRUCTIONS: Final[str] = """
+The user message contains several numbered items instead of a single text. Analyze each item independently, following all the rules above.
+Respond with a single JSON object in this exact format, with one entry per item:
+{
+"results": [
+    {"index": 1, "tags": ["chosen_tag"], "reasoning": "Explanation for item 1."},
+    {"index": 2, "tags": ["chosen_tag"], "reasoning": "Explanation for item 2."}
+]
+}
+"""
+
+MAX_CHARS: Final[int] = 400_000
+
+_JSON_RESPONSE_FORMAT: Final[Dict[str, str]] = {"type": "json_object"}
 
 class TextAnalyzer(BaseProcessor):
     def __init__(self):
@@ -12,6 +110,15 @@ class TextAnalyzer(BaseProcessor):
         """
         text = data.get("text")
         operation = data.get("operation", "analyze")
+
+        texts = data.get("texts")
+        if operation == "analyze_and_single_tag" and isinstance(texts, list):
+            if not texts or not all(self.validate_input(t) for t in texts):
+                return {"error": "Invalid text input"}
+            return {
+                "status": "success",
+                "results": await self.analyze_and_single_tag_batch(texts)
+            }
         
         if not self.validate_input(text):
             return {"error": "Invalid text input"}
@@ -53,97 +160,92 @@ class TextAnalyzer(BaseProcessor):
         Returns:
             Dict containing the analysis result with a single tag and reasoning
         """
-        system_prompt = """
-        [Content Tagging and Analysis System]
-
-        This prompt supports structured analysis and tagging of text content based on user-defined criteria. It ensures a clear, structured response in JSON format, providing reasoning for the chosen tag.
-
-        Prompt Structure
-        Objective:
-        To analyze and tag text content based on user-provided criteria, assigning a single, most appropriate tag and explaining the reasoning behind the decision.
-        Rules:
-        Always Assign One Tag: The AI must assign one and only one tag from the provided list. If none of the tags fit, assign "other."
-        No Guesswork: The AI must not guess or create new tags under any circumstances.
-        Context Isolation: Analyze only the text provided by the user without considering external knowledge or context.
-        Reasoning Field: Always include a reasoning field in the output that explains:
-        Key elements identified in the text.
-        Why the chosen tag is the most appropriate.
-        Output Format: Responses must strictly adhere to this JSON format:
-        {
-        "data": {
-            "tags": ["chosen_tag"],
-            "reasoning": "Detailed explanation of the reasoning process, including key elements identified in the text, and why the tag was chosen."
-        }
-        }
-        Examples:
-        Example 1: Typical instruction
-
-        USER: Determine whether the described subject is a human, an animal, or something else.
-        TEXT: Golden retrievers are known for their gentle nature, loyalty, and intelligence. They are often used as guide dogs.
-        ASSISTANT:
-        {
-        "data": {
-            "tags": ["animal"],
-            "reasoning": "The text describes a 'golden retriever,' explicitly identifying it as a dog, which fits the 'animal' category."
-        }
-        }
-        Example 2: No match
-
-        USER: Does this description refer to a human, an animal, or a machine?
-        TEXT: A cactus is a desert plant that stores water in its stems.
-        ASSISTANT:
-        {
-        "data": {
-            "tags": ["other"],
-            "reasoning": "The text describes a 'cactus,' which does not match the provided tags (human, animal, or machine). Therefore, the 'other' tag is assigned."
-        }
-        }
-        Example 3: Abstract concept
-
-        USER: Assign one tag: human, animal, sport, or food.
-        TEXT: Apples are a popular fruit, rich in vitamins, often enjoyed as a healthy snack.
-        ASSISTANT:
-        {
-        "data": {
-            "tags": ["food"],
-            "reasoning": "The text centers around 'apples,' which are described as food. This directly aligns with the 'food' tag."
-        }
-        }
-        Example 4: Edge case (Insufficient information)
-
-        USER: Assign a tag: human, animal, plant, machine, or other.
-        TEXT: Friendship is one of the most important aspects of life.
-        ASSISTANT:
-        {
-        "data": {
-            "tags": ["other"],
-            "reasoning": "The text describes an abstract concept ('friendship') and does not correspond to any of the provided tags. Therefore, the 'other' tag is assigned."
-        }
-        }
-        Example 5: Complex text with multiple elements
-
-        USER: Categorize the description based on whether it refers to humans, animals, food, sports, or robots.
-        TEXT: John Smith is a robotics engineer passionate about designing autonomous machines and artificial intelligence. In his free time, he enjoys walking his Labrador, Max, and jogging in nearby parks to stay fit. His favorite dish is homemade lasagna, which he often prepares for his family after a day of working on new technology projects.
-        ASSISTANT:
-        {
-        "data": {
-            "tags": ["human"],
-            "reasoning": "The text primarily focuses on John Smith, a robotics engineer. While other tags (e.g., 'animal' for the dog or 'food' for lasagna) are mentioned, they serve as supporting details, not the central subject."
-        }
-        }
-        """
 
         messages = [
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": _SINGLE_TAG_SYSTEM_PROMPT},
             {"role": "user", "content": text}
         ]
 
         result = await self.openai_client.chat_completion(
             messages=messages,
-            temperature=0.3
+            temperature=0,
+            response_format=_JSON_RESPONSE_FORMAT
         )
+        if result.get("status") == "success":
+            result["parsed"] = parse_json_response(result["content"])
 
         return result
 
+    async def analyze_and_single_tag_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """
+        Analyze many texts with a single request, assigning one tag to each
+
+        Args:
+            texts: Texts to analyze
+
+        Returns:
+            List of results in input order, each with status and data (tags, reasoning)
+        """
+        items = "\n".join(f"{i}. {text}" for i, text in enumerate(texts, start=1))
+        messages = [
+            {"role": "system", "content": _SINGLE_TAG_SYSTEM_PROMPT},
+            {"role": "system", "content": _SINGLE_TAG_BATCH_INSTRUCTIONS},
+            {"role": "user", "content": f"Items:\n{items}"}
+        ]
+
+        result = await self.openai_client.chat_completion(
+            messages=messages,
+            temperature=0.3,
+            response_format=_JSON_RESPONSE_FORMAT
+        )
+        if result.get("status") != "success":
+            return [{"status": "error", "error": result.get("error")} for _ in texts]
+
+        payload = parse_json_response(result["content"])
+        try:
+            by_index = {int(item["index"]): item for item in payload["results"]}
+        except (KeyError, TypeError, ValueError) as e:
+            return [{"status": "error", "error": f"Invalid batch response: {e}"} for _ in texts]
+
+        results = []
+        for i in range(1, len(texts) + 1):
+            item = by_index.get(i)
+            if item is None:
+                results.append({"status": "error", "error": f"No result for item {i}"})
+            else:
+                results.append({
+                    "status": "success",
+                    "data": {"tags": item.get("tags", []), "reasoning": item.get("reasoning", "")}
+                })
+        return results
+
+    async def analyze_and_single_tag_batch_offline(self, texts: List[str]) -> str:
+        """
+        Submit single-tag analysis of many texts as an offline Batch API job
+
+        Args:
+            texts: Texts to analyze
+
+        Returns:
+            Batch id; results from OpenAIClient.fetch_batch are keyed "item-{index}"
+        """
+        return await self.openai_client.submit_batch([
+            {
+                "custom_id": f"item-{i}",
+                "body": {
+                    "model": "gpt-4o",
+                    "temperature": 0,
+                    "messages": [
+                        {"role": "system", "content": _SINGLE_TAG_SYSTEM_PROMPT},
+                        {"role": "user", "content": text}
+                    ]
+                }
+            }
+            for i, text in enumerate(texts)
+        ])
+
     def validate_input(self, text: str) -> bool:
-        return bool(text and isinstance(text, str)) 
\ No newline at end of file
+        if not isinstance(text, str) or not text.strip():
+            return False
+        # Zbyt długi tekst i tak zostałby odrzucony przez API - po długim uploadzie
+        return len(text) <= MAX_CHARS
\ No newline at end of file
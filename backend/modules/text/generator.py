@@ -1,10 +1,10 @@
-from typing import Dict, Any
+from typing import Dict, Any, Final
 from ..base_processor import BaseProcessor
-from ..openai_client import OpenAIClient
+from ..openai_client import get_openai_client
 
 class TextGenerator(BaseProcessor):
     def __init__(self):
-        self.openai_client = OpenAIClient()
+        self.openai_client = get_openai_client()
 
     async def process(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -16,16 +16,11 @@ class TextGenerator(BaseProcessor):
         if not self.validate_input(text):
             return {"error": "Invalid text input"}
 
-        operations = {
-            "generate": self.generate_text,
-            "translate": self.translate_text,
-            "paraphrase": self.paraphrase_text
-        }
-
-        if operation not in operations:
+        handler = self._OPS.get(operation)
+        if handler is None:
             return {"error": "Invalid operation"}
 
-        return await operations[operation](data)
+        return await handler(self, data)
 
     async def generate_text(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -74,4 +69,11 @@ class TextGenerator(BaseProcessor):
         """
         Validate text input
         """
-        return bool(text and isinstance(text, str)) 
\ No newline at end of file
+        return bool(text and isinstance(text, str))
+
+    # Mapa operacji budowana raz przy definicji klasy, a nie przy każdym żądaniu
+    _OPS: Final[Dict[str, Any]] = {
+        "generate": generate_text,
+        "translate": translate_text,
+        "paraphrase": paraphrase_text
+    } 
\ No newline at end of file
@@ -1,18 +1,26 @@
+import logging
 import os
-import aiohttp
+import re
+import httpx
+import xxhash
 import asyncio
+import tempfile
+import time
 from io import BytesIO
-from typing import Dict, Any, List, Tuple
+from typing import IO, Dict, Any, List, Optional, Tuple
 from urllib.parse import urljoin, urlparse
-from django.conf import settings
 from core.models import Document, FileAnalysis
 from asgiref.sync import sync_to_async
 from crawl4ai import AsyncWebCrawler
-from .file_analyzer import FileAnalyzer
+import html2text
+from lxml import etree, html as lxml_html
+from .file_analyzer import FileAnalyzer, get_contents_by_hash, hash_file
 from django.utils import timezone
 from datetime import timedelta
-from contextlib import contextmanager
-from django.db import models
+from contextlib import asynccontextmanager, contextmanager
+from django.db import close_old_connections, models
+
+logger = logging.getLogger(__name__)
 
 @contextmanager
 def handle_crawl4ai_errors():
@@ -21,28 +29,144 @@ def handle_crawl4ai_errors():
     except Exception as e:
         if 'filtered_html' in str(e):
             # Jeśli wystąpił błąd z filtered_html, zwracamy pusty string
-            print("Warning: Error with markdown generation, falling back to empty string")
+            logger.warning("Error with markdown generation, falling back to empty string")
             return ""
         raise
 
+# Komunikaty błędów zwracane zamiast treści strony - jedno przejście zamiast skanu per słowo
+_ERR_RE = re.compile('Error|cannot access|filtered_html')
+# Treść uznawana przy sprzątaniu za błędną (bez rozróżniania wielkości liter)
+_STALE_CONTENT_RE = re.compile('error|filtered_html', re.IGNORECASE)
+
+def _has_error(*contents: str) -> bool:
+    """Check whether any of the contents should be purged as an error page"""
+    return any(_STALE_CONTENT_RE.search(content) for content in contents if content)
+
+def purge_stale_documents(ttl: timedelta) -> int:
+    """
+    Delete documents without content, with error messages or older than ttl;
+    WebCrawlerProcessor._get_document must reject the same documents
+
+    Returns:
+        Number of deleted documents
+    """
+    # Jedno zapytanie dla wszystkich warunków
+    expired_time = timezone.now() - ttl
+    deleted, _ = Document.objects.filter(
+        models.Q(original_content__isnull=True) |
+        models.Q(original_content='') |
+        models.Q(processed_content__isnull=True) |
+        models.Q(processed_content='') |
+        models.Q(has_error=True) |
+        models.Q(created_at__lt=expired_time)
+    ).delete()
+    return deleted
+
+# Pliki tymczasowe audio trzymamy w tmpfs (RAM), jeśli system go udostępnia
+_TEMP_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+@asynccontextmanager
+async def _temp_media_file(suffix: str):
+    """Temporary media file, removed on exit; keeps the extension for format detection"""
+    f = tempfile.NamedTemporaryFile(dir=_TEMP_DIR, suffix=suffix, delete=False)
+    try:
+        yield f
+    finally:
+        f.close()
+        try:
+            os.remove(f.name)
+        except FileNotFoundError:
+            pass
+
+def _html_to_markdown(html: str) -> str:
+    """Convert HTML to markdown, keeping links and images on single lines"""
+    # Nowa instancja na wywołanie - HTML2Text trzyma stan parsera i nie nadaje
+    # się do współdzielenia między wątkami
+    h = html2text.HTML2Text()
+    h.ignore_links = False
+    h.ignore_images = False
+    h.body_width = 0
+    return h.handle(html)
+
+def _find_media_sources(html: str) -> List[Tuple[str, str]]:
+    """Find (kind, src) of all img, audio and source elements in a single tree walk"""
+    if not html:
+        return []
+    # Parser na wywołanie - parsery lxml nie mogą być współdzielone między wątkami
+    parser = lxml_html.HTMLParser(encoding='utf-8')
+    try:
+        tree = lxml_html.fromstring(html.encode('utf-8'), parser=parser)
+    except etree.ParserError:
+        return []
+    return [
+        ('images' if element.tag == 'img' else 'audio', element.get('src'))
+        for element in tree.iter('img', 'audio', 'source')
+        if element.get('src')
+    ]
+
 class WebCrawlerProcessor:
+    # Sprzątanie tabeli Document (pełne skany z icontains) najwyżej raz na godzinę
+    # w procesie; regularne czyszczenie robi komenda purge_stale_documents z crona
+    cleanup_interval = 3600
+    _last_cleanup: float = float('-inf')
+
     def __init__(self):
         self.file_analyzer = FileAnalyzer()
         self.supported_media_types = {
-            'images': ['.jpg', '.jpeg', '.png', '.webp'],
-            'audio': ['.mp3', '.wav', '.m4a', '.mp4']
+            'images': ['.jpg', '.jpeg', '.png', '.webp', '.gif'],
+            'audio': [
+                '.mp3', '.wav', '.m4a', '.mp4', '.ogg', '.oga', 
+                '.opus', '.webm', '.aac', '.wma', '.flac'
+            ]
         }
+        # Rozszerzenie -> typ mediów, do sprawdzania jednym lookupem
+        self._ext_to_kind: Dict[str, str] = {
+            extension: media_type
+            for media_type, extensions in self.supported_media_types.items()
+            for extension in extensions
+        }
+        # Wzorce MIME w URL (małymi literami, bo porównujemy z URL po lower())
+        self._mime_patterns: Tuple[Tuple[str, str], ...] = (
+            ('audio/', 'audio'),
+            ('application/ogg', 'audio'),
+            ('application/x-mpegurl', 'audio'),
+            ('application/octet-stream', 'audio'),
+            ('image/', 'images')
+        )
         # Czas ważności cache'a (np. 24 godziny)
         self.cache_ttl = timedelta(hours=24)
+        self._client: Optional[httpx.AsyncClient] = None
+        # Limit równoległych pobrań mediów z jednej strony
+        self.max_concurrency = 8
+        # Media pobieramy strumieniowo, kawałkami po 64 KB
+        self.download_chunk_size = 64 * 1024
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get shared HTTP client for media downloads, creating it on first use"""
+        if self._client is None or self._client.is_closed:
+            # HTTP/2: wiele pobrań z jednego CDN idzie równolegle jednym połączeniem
+            self._client = httpx.AsyncClient(
+                http2=True,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                timeout=30.0
+            )
+        return self._client
+
+    async def aclose(self):
+        """Close shared HTTP clients"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        await self.file_analyzer.aclose()
 
     @sync_to_async
     def _save_document(self, url: str, original_content: str, processed_content: str = None) -> Document:
         """Save document to database"""
         try:
             # Sprawdź czy treść nie jest komunikatem o błędzie
-            error_keywords = ['Error', 'cannot access', 'filtered_html']
-            if any(keyword in str(original_content) for keyword in error_keywords):
-                print(f"Detected error message in content, skipping save: {original_content}")
+            if _ERR_RE.search(str(original_content)):
+                logger.warning("Detected error message in content, skipping save: %s", original_content)
                 return None
             
             # Upewnij się, że mamy jakąś treść
@@ -51,25 +175,28 @@ class WebCrawlerProcessor:
             if not processed_content:
                 processed_content = original_content
 
-            # Usuń dokumenty z tym samym URL
-            Document.objects.filter(url=url).delete()
-                
             # Zachowaj oryginalną treść HTML przed konwersją na markdown
             if hasattr(self, '_original_html'):
                 original_content = self._original_html
                 
-            return Document.objects.create(
+            # Nadpisz dokument z tym samym URL; created_at odświeżamy,
+            # bo od niego liczony jest czas ważności cache'a
+            document, _ = Document.objects.update_or_create(
                 url=url,
-                original_content=original_content,
-                processed_content=processed_content
+                defaults={
+                    'original_content': original_content,
+                    'processed_content': processed_content,
+                    'has_error': _has_error(original_content, processed_content),
+                    'created_at': timezone.now()
+                }
             )
+            return document
         except Exception as e:
-            print(f"Error saving document: {str(e)}")
+            logger.error("Error saving document: %s", e)
             return None
 
-    @sync_to_async
     def _get_document(self, url: str) -> Document:
-        """Get document from database if exists and not expired"""
+        """Get document from database if it exists, is not expired and is not an error page"""
         try:
             doc = Document.objects.get(url=url)
             age = timezone.now() - doc.created_at
@@ -79,8 +206,8 @@ class WebCrawlerProcessor:
                 doc.delete()
                 return None
                 
-            # Sprawdź czy dokument ma poprawną zawartość
-            if not doc.original_content or not doc.processed_content:
+            # Sprawdź czy dokument ma poprawną zawartość i nie jest stroną błędu
+            if not doc.original_content or not doc.processed_content or doc.has_error:
                 doc.delete()
                 return None
                 
@@ -88,95 +215,150 @@ class WebCrawlerProcessor:
         except Document.DoesNotExist:
             return None
         except Exception as e:
-            print(f"Error getting document: {str(e)}")
+            logger.error("Error getting document: %s", e)
             return None
 
-    async def _download_media(self, url: str) -> bytes:
-        """Download media file from URL"""
+    async def _download_media(self, url: str, sink: IO[bytes]) -> bool:
+        """Stream media file from URL into sink, return whether anything was downloaded"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        return await response.read()
-                    return None
+            async with self._get_client().stream('GET', url) as response:
+                if response.status_code != 200:
+                    return False
+                downloaded = 0
+                async for chunk in response.aiter_bytes(self.download_chunk_size):
+                    sink.write(chunk)
+                    downloaded += len(chunk)
+                return downloaded > 0
         except Exception as e:
-            print(f"Error downloading media from {url}: {str(e)}")
-            return None
+            logger.error("Error downloading media from %s: %s", url, e)
+            return False
 
     def _is_supported_media(self, url: str) -> Tuple[bool, str]:
         """Check if URL points to supported media file"""
-        lower_url = url.lower()
-        
-        # Rozszerzamy listę rozpoznawanych formatów audio
-        self.supported_media_types = {
-            'images': ['.jpg', '.jpeg', '.png', '.webp', '.gif'],
-            'audio': [
-                '.mp3', '.wav', '.m4a', '.mp4', '.ogg', '.oga', 
-                '.opus', '.webm', '.aac', '.wma', '.flac'
-            ]
-        }
-        
-        # Sprawdzamy rozszerzenia
-        for media_type, extensions in self.supported_media_types.items():
-            if any(lower_url.endswith(ext) for ext in extensions):
-                print(f"Detected {media_type} by extension in URL: {url}")
-                return True, media_type
+        # Sprawdzamy rozszerzenie ścieżki
+        extension = os.path.splitext(urlparse(url).path)[1].lower()
+        media_type = self._ext_to_kind.get(extension)
+        if media_type:
+            logger.debug("Detected %s by extension in URL: %s", media_type, url)
+            return True, media_type
         
         # Sprawdzamy MIME types w URL
-        mime_patterns = {
-            'audio': ['audio/', 'application/ogg', 'application/x-mpegURL', 'application/octet-stream'],
-            'images': ['image/']
-        }
-        
-        for media_type, patterns in mime_patterns.items():
-            if any(pattern in lower_url for pattern in patterns):
-                print(f"Detected {media_type} by MIME pattern in URL: {url}")
+        lower_url = url.lower()
+        for pattern, media_type in self._mime_patterns:
+            if pattern in lower_url:
+                logger.debug("Detected %s by MIME pattern in URL: %s", media_type, url)
                 return True, media_type
         
         # Sprawdzamy dodatkowe wzorce w URL
         if '/audio/' in lower_url or 'sound' in lower_url or 'music' in lower_url:
-            print(f"Detected audio by URL pattern: {url}")
+            logger.debug("Detected audio by URL pattern: %s", url)
             return True, 'audio'
         
         return False, None
 
+    @staticmethod
+    def _replace_literals(markdown: str, replacements: Dict[str, str]) -> str:
+        """Replace all literal patterns in a single pass over markdown"""
+        if not replacements:
+            return markdown
+        # Najdłuższe najpierw - krótszy wzorzec nie przechwyci prefiksu dłuższego
+        pattern = re.compile("|".join(
+            re.escape(key) for key in sorted(replacements, key=len, reverse=True)
+        ))
+        return pattern.sub(lambda match: replacements[match.group(0)], markdown)
+
+    @staticmethod
+    def _audio_tag_patterns(link: str) -> Tuple[str, str]:
+        """Regexes matching a single <audio> or <source> tag pointing at link"""
+        escaped = re.escape(link)
+        # Dopasowanie nie może wyjść poza jeden tag <audio>/<source>
+        return (
+            rf'<audio\b(?:(?!</?audio\b).)*?src="{escaped}"(?:(?!</?audio\b).)*?</audio>',
+            rf'<source\b[^>]*src="{escaped}"[^>]*>'
+        )
+
+    @staticmethod
+    def _replace_media_tags(markdown: str, tag_replacements: List[Tuple[str, str]]) -> str:
+        """Replace HTML media tags matched by regex patterns in a single pass over markdown"""
+        if not tag_replacements:
+            return markdown
+        # Każdy wzorzec we własnej grupie - numer grupy wskazuje zamianę
+        pattern = re.compile(
+            "|".join(f"({regex})" for regex, _ in tag_replacements),
+            re.DOTALL
+        )
+        return pattern.sub(lambda match: tag_replacements[match.lastindex - 1][1], markdown)
+
     def _get_absolute_url(self, base_url: str, media_url: str) -> str:
         """Convert relative URL to absolute"""
         if media_url.startswith(('http://', 'https://')):
             return media_url
         return urljoin(base_url, media_url)
 
-    async def _process_media_file(self, url: str, media_type: str, content: bytes) -> str:
-        """Process media file and return description/transcription"""
+    async def _get_description_by_hash(self, digest: str) -> Optional[str]:
+        """
+        Get description of a file with the same content analyzed earlier,
+        on any page or by FileAnalyzer (same xxh3 content hash)
+        """
         try:
-            # Create a file-like object from bytes
-            from io import BytesIO
-            file_obj = BytesIO(content)
-            file_obj.name = os.path.basename(urlparse(url).path)
+            return (await get_contents_by_hash([digest], self.cache_ttl)).get(digest)
+        except Exception as e:
+            logger.error("Error getting cached description: %s", e)
+            return None
+
+    @staticmethod
+    def _read_bytes(file_path: str) -> bytes:
+        """Read whole file contents"""
+        with open(file_path, 'rb') as file:
+            return file.read()
+
+    async def _process_media_file(self, url: str, media_type: str, page_url: Optional[str] = None) -> Optional[str]:
+        """
+        Download media file and return description/transcription,
+        or None if it could not be downloaded; descriptions (new or reused
+        by content hash) are saved under page_url, so the page's cached
+        media list stays complete
+        """
+        try:
+            file_name = os.path.basename(urlparse(url).path)
 
             if media_type == 'images':
-                result = await self.file_analyzer._process_image(file_obj)
-                return result if isinstance(result, str) else ""
+                # Pobieramy obraz prosto do bufora w pamięci
+                file_obj = BytesIO()
+                if not await self._download_media(url, file_obj):
+                    return None
+                with file_obj.getbuffer() as buffer:
+                    digest = xxhash.xxh3_64_hexdigest(buffer)
+                description = await self._get_description_by_hash(digest)
+                if description is None:
+                    file_obj.seek(0)
+                    file_obj.name = file_name
+                    result = await self.file_analyzer._process_image(file_obj)
+                    description = result if isinstance(result, str) else ""
+                if page_url is not None:
+                    await self._save_media_analysis(page_url, url, media_type, file_obj.getvalue(), description)
+                return description
             elif media_type == 'audio':
-                # Zapisz tymczasowo plik audio na dysku
-                temp_path = os.path.join(settings.MEDIA_ROOT, 'temp', file_obj.name)
-                os.makedirs(os.path.dirname(temp_path), exist_ok=True)
-                
-                try:
-                    with open(temp_path, 'wb') as f:
-                        f.write(content)
-                    result = await self.file_analyzer._process_audio(temp_path)
-                finally:
-                    # Usuń plik tymczasowy
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
-                
-                return result.get('text', '') if isinstance(result, dict) else str(result)
+                # Pobieramy audio prosto do pliku tymczasowego (w RAM, jeśli jest tmpfs)
+                async with _temp_media_file(os.path.splitext(file_name)[1]) as f:
+                    downloaded = await self._download_media(url, f)
+                    f.close()
+                    if not downloaded:
+                        return None
+                    digest = await asyncio.to_thread(hash_file, f.name)
+                    description = await self._get_description_by_hash(digest)
+                    if description is None:
+                        result = await self.file_analyzer._process_audio(f.name)
+                        description = result.get('text', '') if isinstance(result, dict) else str(result)
+                    if page_url is not None:
+                        content = await asyncio.to_thread(self._read_bytes, f.name)
+                        await self._save_media_analysis(page_url, url, media_type, content, description)
+
+                return description
                 
             return ""
         except Exception as e:
-            print(f"Error processing {media_type} file {url}: {str(e)}")
-            print(f"Full error details:", e.__class__.__name__, str(e))
+            logger.error("Error processing %s file %s (%s): %s", media_type, url, type(e).__name__, e)
             return ""
 
     @sync_to_async
@@ -188,10 +370,10 @@ class WebCrawlerProcessor:
             
             # Upewnij się, że mamy opis
             if not description:
-                print(f"Warning: No description for {file_name}")
+                logger.warning("No description for %s", file_name)
                 description = ""
             
-            print(f"Saving media analysis for {file_name} with description: {description[:100]}...")
+            logger.debug("Saving media analysis for %s with description: %.100s...", file_name, description)
             
             FileAnalysis.objects.update_or_create(
                 file_name=file_name,
@@ -199,63 +381,74 @@ class WebCrawlerProcessor:
                     'file_type': extension,
                     'content': description,
                     'raw_content': content,
+                    'content_hash': xxhash.xxh3_64_hexdigest(content),
                     'category': media_type
                 }
             )
         except Exception as e:
-            print(f"Error saving media analysis: {str(e)}")
+            logger.error("Error saving media analysis: %s", e)
 
-    @sync_to_async
+    # Poza wspólnym wątkiem sync_to_async, żeby sprzątanie szło równolegle z odczytem cache
+    @sync_to_async(thread_sensitive=False)
     def _cleanup_invalid_documents(self):
         """Clean up invalid documents from database"""
         try:
-            # Usuń dokumenty bez zawartości
-            Document.objects.filter(
-                models.Q(original_content__isnull=True) |
-                models.Q(original_content='') |
-                models.Q(processed_content__isnull=True) |
-                models.Q(processed_content='')
-            ).delete()
-            
-            # Usuń dokumenty zawierające komunikaty o błędach
-            Document.objects.filter(
-                models.Q(original_content__icontains='Error') |
-                models.Q(original_content__icontains='filtered_html') |
-                models.Q(processed_content__icontains='Error') |
-                models.Q(processed_content__icontains='filtered_html')
-            ).delete()
-            
-            # Usuń przeterminowane dokumenty
-            expired_time = timezone.now() - self.cache_ttl
-            Document.objects.filter(created_at__lt=expired_time).delete()
+            purge_stale_documents(self.cache_ttl)
         except Exception as e:
-            print(f"Error cleaning up documents: {str(e)}")
+            logger.error("Error cleaning up documents: %s", e)
+        finally:
+            # Wątek z puli nie przechodzi przez cykl żądania - zamknij jego połączenie
+            close_old_connections()
+
+    async def _maybe_cleanup_documents(self):
+        """Clean up documents at most once per cleanup_interval in this process"""
+        now = time.monotonic()
+        if now - WebCrawlerProcessor._last_cleanup < self.cleanup_interval:
+            return
+        WebCrawlerProcessor._last_cleanup = now
+        await self._cleanup_invalid_documents()
 
-    @sync_to_async
     def _get_cached_media(self, url: str) -> List[Dict[str, Any]]:
         """Get cached media files for URL"""
         try:
             # Szukaj mediów z prefiksem URL
-            media_files = []
-            for analysis in FileAnalysis.objects.filter(file_name__startswith=f"{url}::"):
-                media_url = analysis.file_name.split("::", 1)[1]
-                media_files.append({
-                    "url": media_url,
-                    "type": analysis.category,
-                    "description": analysis.content
-                })
-            return media_files
+            analyses = FileAnalysis.objects.filter(
+                file_name__startswith=f"{url}::"
+            ).values_list('file_name', 'category', 'content')
+            return [
+                {
+                    "url": file_name.split("::", 1)[1],
+                    "type": category,
+                    "description": content
+                }
+                for file_name, category, content in analyses
+            ]
         except Exception as e:
-            print(f"Error getting cached media: {str(e)}")
+            logger.error("Error getting cached media: %s", e)
             return []
 
+    @sync_to_async
+    def _get_media_analyses(self, file_names: List[str]) -> Dict[str, FileAnalysis]:
+        """Get media analyses for all given file names in one query"""
+        return {
+            analysis.file_name: analysis
+            for analysis in FileAnalysis.objects.filter(file_name__in=file_names)
+        }
+
+    @sync_to_async
+    def _load_cache(self, url: str) -> Tuple[Optional[Document], List[Dict[str, Any]]]:
+        """Get cached document and its media in a single thread hop"""
+        return self._get_document(url), self._get_cached_media(url)
+
     async def process_url(self, url: str) -> Dict[str, Any]:
         try:
-            await self._cleanup_invalid_documents()
-            
-            # Sprawdź cache dokumentu
-            cached_doc = await self._get_document(url)
-            cached_media = await self._get_cached_media(url)
+            # Sprawdź cache dokumentu; _get_document sam odrzuca wszystko, co usuwa
+            # purge_stale_documents (przeterminowane, puste i błędne dokumenty),
+            # więc sprzątanie nie musi go poprzedzać
+            _, (cached_doc, cached_media) = await asyncio.gather(
+                self._maybe_cleanup_documents(),
+                self._load_cache(url)
+            )
             
             if cached_doc:
                 if cached_doc.processed_content:
@@ -269,7 +462,7 @@ class WebCrawlerProcessor:
                     }
                 elif cached_doc.original_content:
                     # Jeśli mamy tylko oryginalną treść, przetworzymy ją ponownie
-                    print("Found cached original content, processing it...")
+                    logger.debug("Found cached original content, processing it...")
                     original_markdown = cached_doc.original_content
                 else:
                     # Jeśli nie mamy żadnej treści, usuń dokument
@@ -306,128 +499,109 @@ class WebCrawlerProcessor:
                     # Zachowaj oryginalną treść HTML
                     self._original_html = result.html
 
-                    # Konwertuj HTML na Markdown
-                    import html2text
-                    h = html2text.HTML2Text()
-                    h.ignore_links = False
-                    h.ignore_images = False
-                    h.body_width = 0
-                    
-                    original_markdown = h.handle(result.html)
+                    # Konwertuj HTML na Markdown poza pętlą zdarzeń
+                    original_markdown = await asyncio.to_thread(_html_to_markdown, result.html)
 
             # Przetwórz markdown (dodaj opisy mediów)
             processed_markdown = original_markdown
             media_files = []
 
-            # Użyj BeautifulSoup do analizy HTML
-            from bs4 import BeautifulSoup
-
             # Przetwórz media tylko jeśli nie mamy ich w cache
             if not cached_media:
                 # Analizuj oryginalny HTML, nie markdown
-                soup = BeautifulSoup(self._original_html, 'html.parser')
+                media_sources = await asyncio.to_thread(_find_media_sources, self._original_html)
                 
-                # Znajdź i przetwórz obrazy
-                images = soup.find_all('img')
-                for img in images:
-                    src = img.get('src')
-                    if src:
-                        media_url = self._get_absolute_url(url, src)
-                        print(f"Found image: {media_url}")
-                        is_supported, detected_type = self._is_supported_media(media_url)
-                        if is_supported:
-                            media_content = await self._download_media(media_url)
-                            if media_content:
-                                description = await self._process_media_file(
-                                    media_url, 
-                                    detected_type, 
-                                    media_content
-                                )
-                                media_files.append({
-                                    "url": media_url,
-                                    "type": "images",
-                                    "description": description
-                                })
-                                # Dodaj opis do markdown - szukaj różnych wariantów linków
-                                patterns = [
-                                    f"![]({src})",
-                                    f"![]({media_url})",
-                                    f"![{src}]({src})",
-                                    f"![{media_url}]({media_url})"
-                                ]
-                                img_with_desc = f"![{description}]({media_url})"
-                                
-                                for pattern in patterns:
-                                    processed_markdown = processed_markdown.replace(pattern, img_with_desc)
-
-                # Znajdź i przetwórz pliki audio
-                audio_elements = soup.find_all(['audio', 'source'])
-                for audio in audio_elements:
-                    src = audio.get('src')
-                    if src:
-                        media_url = self._get_absolute_url(url, src)
-                        print(f"Found audio: {media_url}")
-                        is_supported, detected_type = self._is_supported_media(media_url)
-                        if is_supported:
-                            media_content = await self._download_media(media_url)
-                            if media_content:
-                                description = await self._process_media_file(
-                                    media_url, 
-                                    detected_type, 
-                                    media_content
-                                )
-                                media_files.append({
-                                    "url": media_url,
-                                    "type": "audio",
-                                    "description": description
-                                })
-                                
-                                # Przygotuj nowy format audio z transkrypcją
-                                audio_with_desc = (
-                                    f"\n\n**Audio Transcription:**\n\n"
-                                    f"{description}\n\n"
-                                    f"[🔊 Listen to original audio]({media_url})\n\n"
-                                )
-                                
-                                # Znajdź i zamień wszystkie możliwe warianty audio w markdown
-                                patterns = [
-                                    f'<audio.*?src="{src}".*?</audio>',
-                                    f'<audio.*?src="{media_url}".*?</audio>',
-                                    f'<source.*?src="{src}".*?>',
-                                    f'<source.*?src="{media_url}".*?>',
-                                    f'[{os.path.basename(src)}]({src})',
-                                    f'[{os.path.basename(media_url)}]({media_url})',
-                                    f'[Audio]({src})',
-                                    f'[Audio]({media_url})'
-                                ]
-                                
-                                for pattern in patterns:
-                                    if pattern in processed_markdown:
-                                        processed_markdown = processed_markdown.replace(pattern, audio_with_desc)
+                # Zbierz obsługiwane media bez powtórzeń:
+                # media_url -> (kind, detected_type, wszystkie warianty src ze strony)
+                media_tasks: Dict[str, Tuple[str, str, List[str]]] = {}
+                for kind, src in media_sources:
+                    # Osadzone dane i puste adresy nie są plikami do pobrania
+                    if not src.strip() or src.startswith('data:'):
+                        continue
+                    media_url = self._get_absolute_url(url, src)
+                    if media_url in media_tasks:
+                        sources = media_tasks[media_url][2]
+                        if src not in sources:
+                            sources.append(src)
+                        continue
+                    logger.debug("Found %s: %s", kind, media_url)
+                    is_supported, detected_type = self._is_supported_media(media_url)
+                    if is_supported:
+                        media_tasks[media_url] = (kind, detected_type, [src])
+
+                # Pobierz i przetwórz media równolegle, z limitem jednoczesnych pobrań
+                semaphore = asyncio.BoundedSemaphore(self.max_concurrency)
+
+                async def fetch_one(media_url: str, kind: str, detected_type: str, sources: List[str]):
+                    async with semaphore:
+                        description = await self._process_media_file(media_url, detected_type, url)
+                        if description is None:
+                            return None
+                        return media_url, kind, sources, description
+
+                # Każdy unikalny plik pobieramy i opisujemy tylko raz
+                results = await asyncio.gather(
+                    *(fetch_one(media_url, *task) for media_url, task in media_tasks.items()),
+                    return_exceptions=True
+                )
+
+                # Zbierz wszystkie zamiany i wykonaj je jednym przejściem po markdown
+                replacements: Dict[str, str] = {}
+                tag_replacements: List[Tuple[str, str]] = []
+                for result in results:
+                    if isinstance(result, Exception):
+                        logger.error("Error processing media: %s", result)
+                        continue
+                    if result is None:
+                        continue
+                    media_url, kind, sources, description = result
+                    media_files.append({
+                        "url": media_url,
+                        "type": kind,
+                        "description": description
+                    })
+
+                    if kind == 'images':
+                        # Dodaj opis do markdown - szukaj różnych wariantów linków
+                        img_with_desc = f"![{description}]({media_url})"
+                        for link in (*sources, media_url):
+                            replacements[f"![]({link})"] = img_with_desc
+                            replacements[f"![{link}]({link})"] = img_with_desc
+                    else:
+                        # Przygotuj nowy format audio z transkrypcją
+                        audio_with_desc = (
+                            f"\n\n**Audio Transcription:**\n\n"
+                            f"{description}\n\n"
+                            f"[🔊 Listen to original audio]({media_url})\n\n"
+                        )
+                        
+                        # Znajdź i zamień wszystkie możliwe warianty audio w markdown
+                        for link in (*sources, media_url):
+                            for regex in self._audio_tag_patterns(link):
+                                tag_replacements.append((regex, audio_with_desc))
+                            replacements[f'[{os.path.basename(link)}]({link})'] = audio_with_desc
+                            replacements[f'[Audio]({link})'] = audio_with_desc
+
+                processed_markdown = self._replace_media_tags(processed_markdown, tag_replacements)
+                processed_markdown = self._replace_literals(processed_markdown, replacements)
             else:
                 # Użyj mediów z cache, ale sprawdź czy mają opisy
+                base_names = [os.path.basename(media['url']) for media in cached_media]
+                analyses = await self._get_media_analyses(
+                    [f"{url}::{base_name}" for base_name in base_names] + base_names
+                )
+
                 media_files = []
-                for cached_media in cached_media:
-                    base_name = os.path.basename(cached_media['url'])
-                    
-                    try:
-                        # Najpierw spróbuj znaleźć plik z pełną ścieżką
-                        file_analysis = await sync_to_async(FileAnalysis.objects.get)(
-                            file_name=f"{url}::{base_name}"
-                        )
-                    except FileAnalysis.DoesNotExist:
-                        try:
-                            # Jeśli nie znaleziono, spróbuj samą nazwę pliku
-                            file_analysis = await sync_to_async(FileAnalysis.objects.get)(
-                                file_name=base_name
-                            )
-                        except FileAnalysis.DoesNotExist:
-                            print(f"Warning: No analysis found for {base_name}")
-                            continue
+                for cached_media, base_name in zip(cached_media, base_names):
+                    # Najpierw plik z pełną ścieżką, potem sama nazwa pliku
+                    file_analysis = analyses.get(f"{url}::{base_name}") or analyses.get(base_name)
+                    if file_analysis is None:
+                        logger.warning("No analysis found for %s", base_name)
+                        continue
                     
                     # Jeśli content jest pusty, wygeneruj nowy opis
                     if not file_analysis.content and file_analysis.raw_content:
-                        print(f"Regenerating description for {base_name}")
+                        logger.debug("Regenerating description for %s", base_name)
                         
                         if cached_media['type'] == 'images':
                             # Utwórz BytesIO z raw_content dla obrazów
@@ -436,16 +610,10 @@ class WebCrawlerProcessor:
                             description = await self.file_analyzer._process_image(file_obj)
                         elif cached_media['type'] == 'audio':
                             # Zapisz tymczasowo plik audio
-                            temp_path = os.path.join(settings.MEDIA_ROOT, 'temp', base_name)
-                            os.makedirs(os.path.dirname(temp_path), exist_ok=True)
-                            
-                            try:
-                                with open(temp_path, 'wb') as f:
-                                    f.write(file_analysis.raw_content)
-                                description = await self.file_analyzer._process_audio(temp_path)
-                            finally:
-                                if os.path.exists(temp_path):
-                                    os.remove(temp_path)
+                            async with _temp_media_file(os.path.splitext(base_name)[1]) as f:
+                                f.write(file_analysis.raw_content)
+                                f.close()
+                                description = await self.file_analyzer._process_audio(f.name)
                         
                         # Zaktualizuj opis w bazie danych
                         file_analysis.content = description
@@ -469,8 +637,10 @@ class WebCrawlerProcessor:
                         img_with_desc = f"![{cached_media['description']}](i/{base_name})"
                         
                         for pattern in patterns:
-                            if pattern in processed_markdown:
-                                processed_markdown = processed_markdown.replace(pattern, img_with_desc)
+                            # Bez osobnego sprawdzenia "in" - replace skanuje tekst tylko raz
+                            replaced = processed_markdown.replace(pattern, img_with_desc)
+                            if replaced != processed_markdown:
+                                processed_markdown = replaced
                                 break
                                 
                     elif cached_media['type'] == 'audio':
@@ -491,8 +661,10 @@ class WebCrawlerProcessor:
                         )
                         
                         for pattern in patterns:
-                            if pattern in processed_markdown:
-                                processed_markdown = processed_markdown.replace(pattern, audio_with_desc)
+                            # Bez osobnego sprawdzenia "in" - replace skanuje tekst tylko raz
+                            replaced = processed_markdown.replace(pattern, audio_with_desc)
+                            if replaced != processed_markdown:
+                                processed_markdown = replaced
                                 break
 
             # Zapisz dokument
@@ -507,8 +679,7 @@ class WebCrawlerProcessor:
             }
 
         except Exception as e:
-            print(f"Error processing URL {url}: {str(e)}")
-            print(f"Full error details:", e.__class__.__name__, str(e))
+            logger.error("Error processing URL %s (%s): %s", url, type(e).__name__, e)
             return {
                 "status": "error",
                 "message": f"Error processing {url}: {str(e)}"